@@ -1,15 +1,36 @@
 import os
+import sys
+import argparse
 import logging
-from typing import Optional
+from typing import TYPE_CHECKING, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import time
+import asyncio
+import threading
+from collections import deque
 from prompt_generator import PromptGenerator
 from image_generator import ImageGenerator
-from image_analyzer import ImageAnalyzer
+from generation_backends import GenerationBackend, LocalBackend
+from image_analyzer import ImageAnalyzer, ScoreBatcher
 from social_media import SocialMediaManager
+from http_client import AsyncHTTPClient
+from batch import own_title_directory, read_titles, run_batch
+from image_cache import ImageCache
+from prompt_cache import PromptCache
+from publish_queue import PinterestPublisher, PublishQueue
+from manifest import RunManifest
+from checkpoint import TitleCheckpoint
+import metrics
+
+# How many winner paths a generator remembers in generated_images
+RECENT_IMAGES = 1000
+
+# Both load NumPy and Pillow; main imports them only when they are switched on
+if TYPE_CHECKING:
+    from dedupe_index import DedupeIndex
+    from image_quality import ImagePrefilter
 
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s: %(message)s',
@@ -21,95 +42,852 @@ logging.basicConfig(
 
 class SceneImageGenerator:
     def __init__(self, cloudflare_account_id: str, cloudflare_api_token: str, 
-                 pinterest_email: str = None, pinterest_password: str = None, mistral_api_key:str=None):
-        self.prompt_generator = PromptGenerator(cloudflare_account_id, cloudflare_api_token)
-        self.image_generator = ImageGenerator(cloudflare_account_id, cloudflare_api_token)
-        self.image_analyzer = ImageAnalyzer(mistral_api_key=mistral_api_key)
+                 pinterest_email: str = None, pinterest_password: str = None, mistral_api_key:str=None,
+                 max_workers: int = 1, image_cache: Optional[ImageCache] = None, seed: Optional[int] = None,
+                 prompt_cache: Optional[PromptCache] = None, fresh_prompts: bool = False,
+                 prefilter: Optional["ImagePrefilter"] = None, upload_max_side: Optional[int] = None,
+                 upload_jpeg_quality: Optional[int] = None, speculative: int = 1,
+                 speculative_prompts: Optional[int] = None, cloudflare_api_base: Optional[str] = None,
+                 mistral_server_url: Optional[str] = None, publish_queue: Optional[PublishQueue] = None,
+                 publish_workers: int = 2, dedupe_index: Optional["DedupeIndex"] = None, checkpoints: bool = True,
+                 score_batch: int = 1, score_batch_wait: float = 0.05, score_jitter: bool = False,
+                 score_seed: Optional[int] = None, image_backend: Optional[GenerationBackend] = None,
+                 drafts: bool = False):
+        self.http_client = AsyncHTTPClient()
+        self.prompt_generator = PromptGenerator(cloudflare_account_id, cloudflare_api_token, http_client=self.http_client,
+                                                cache=prompt_cache, fresh=fresh_prompts, api_base=cloudflare_api_base)
+        self.image_generator = ImageGenerator(cloudflare_account_id, cloudflare_api_token, http_client=self.http_client,
+                                              cache=image_cache, seed=seed, api_base=cloudflare_api_base,
+                                              backend=image_backend)
+        self.image_analyzer = ImageAnalyzer(mistral_api_key=mistral_api_key, prefilter=prefilter,
+                                            upload_max_side=upload_max_side, upload_jpeg_quality=upload_jpeg_quality,
+                                            server_url=mistral_server_url, batch_size=score_batch,
+                                            jitter=score_jitter, jitter_seed=score_seed)
         self.social_media = SocialMediaManager(pinterest_email, pinterest_password) if pinterest_email and pinterest_password else None
-        self.generated_images = []
-        
-    def process_title(self, title: str, max_iterations: int = 2, score_threshold: float = 8.39, max_retries: int = 3):
-        """Main process to generate and refine scenes."""
-        print(f"\nGenerating concept art for: {title}")
-        
-        try:
-            scenes = self.prompt_generator.generate_scenes(title)
-            if not scenes or len(scenes) < 6:
-                logging.error("Failed to generate valid scenes")
-                return False
+        # With a publish queue, uploads run on background workers and survive restarts instead of blocking run_title
+        self.publisher = None
+        if self.social_media and publish_queue is not None:
+            self.publisher = PinterestPublisher(self.social_media, publish_queue, publish_workers).start()
+        self.max_workers = max(1, max_workers)
+        # Best-of-N: candidates fired per scene round, and how many of them use alternate prompts
+        self.speculative = max(1, speculative)
+        self.speculative_prompts = (self.speculative - 1) // 2 if speculative_prompts is None else speculative_prompts
+        # Near-duplicates of any earlier image, from any title, are neither scored nor published
+        self.dedupe_index = dedupe_index
+        # Save each title's progress so a rerun after a crash skips finished scenes
+        self.checkpoints = checkpoints
+        # Two-pass generation: score a cheap draft, then render only passing drafts at the final tier
+        self.drafts = drafts
+        # Images from concurrent scenes of a title are scored together, up to score_batch per Pixtral request
+        self.score_batcher = ScoreBatcher(self.image_analyzer, score_batch_wait) if score_batch > 1 else None
+        # Most recent winners only; a --serve process keeps one generator alive for good
+        self.generated_images = deque(maxlen=RECENT_IMAGES)
+        self._images_lock = threading.Lock()
 
-            best_versions = {}
-            
-            for i, prompt in enumerate(scenes):
-                success = False
-                retry_count = 0
-                current_prompt = prompt
-                
-                while retry_count < max_retries and not success:
-                    print(f"\nGenerating image for scene {i + 1} (Attempt {retry_count + 1}/{max_retries})...")
-                    image_path = self.image_generator.generate_image(current_prompt, i + 1)
-                    
-                    if image_path and os.path.exists(image_path):
-                        self.generated_images.append(image_path)  
-                        score = self.image_analyzer.analyze_image(image_path, current_prompt)
-                        
-                        if score is not None:
-                            print(f"Scene {i + 1} score: {score}")
-                            
-                            if score >= score_threshold:
-                                best_versions[i] = (score, image_path, current_prompt)
-                                print(f"✓ Scene {i + 1} generated successfully with score: {score}")
-                                success = True
-                            else:
-                                print(f"× Score too low ({score}). Generating new prompt...")
-                                current_prompt = self.prompt_generator.regenerate_scene(title, i + 1)
-                                retry_count += 1
-                        else:
-                            print("× Failed to get valid score. Retrying...")
+    def _run_scene(self, process_scene, title: str, index: int, prompt: str, score_threshold: float,
+                   max_retries: int, output_directory: Optional[str], manifest: RunManifest,
+                   checkpoint: TitleCheckpoint) -> dict:
+        """Run one scene unless an earlier, interrupted run of the title already finished it."""
+        done = checkpoint.completed(index)
+        if done is not None:
+            print(f"✓ Scene {index + 1} already finished in an earlier run, skipping")
+            return done
+        scene_result = process_scene(title, index, prompt, score_threshold, max_retries, output_directory,
+                                     manifest, checkpoint)
+        checkpoint.complete(index, scene_result)
+        return scene_result
+
+    async def _run_scene_async(self, title: str, index: int, prompt: str, score_threshold: float,
+                               max_retries: int, output_directory: Optional[str], manifest: RunManifest,
+                               checkpoint: TitleCheckpoint) -> dict:
+        """Async version of _run_scene."""
+        done = checkpoint.completed(index)
+        if done is not None:
+            print(f"✓ Scene {index + 1} already finished in an earlier run, skipping")
+            return done
+        scene_result = await self._process_scene_async(title, index, prompt, score_threshold, max_retries,
+                                                       output_directory, manifest, checkpoint)
+        checkpoint.complete(index, scene_result)
+        return scene_result
+
+    @property
+    def _first_tier(self) -> str:
+        return "draft" if self.drafts else "final"
+
+    def _final_steps(self, draft, prompt: str, score: float, score_threshold: float, index: int,
+                     manifest: Optional[RunManifest]):
+        """With drafts on, re-render a passing draft at the final tier with the same prompt and seed.
+        The final is a new image, so it is checked for duplicates and scored on its own.
+        Returns (image, score) to accept, the draft and its score when drafts are off,
+        or None if the final render failed or was rejected. Steps as in _scene_steps."""
+        if not self.drafts:
+            return draft, score
+        print(f"Rendering final image for scene {index + 1}...")
+        generation_start = time.perf_counter()
+        final = yield "generate", {"prompt": prompt, "seed": draft.seed, "tier": "final"}
+        generation_seconds = time.perf_counter() - generation_start
+        if final is None:
+            _record_attempt(manifest, index, prompt, None, None, "final render failed", False, generation_seconds)
+            return None
+        duplicate = yield "duplicate", {"image": final, "ignore": draft.path}
+        if duplicate is not None:
+            _record_attempt(manifest, index, prompt, final, None, duplicate, False, generation_seconds)
+            return None
+        analysis_start = time.perf_counter()
+        final_score, reason = yield "evaluate", {"image": final, "prompt": prompt}
+        accepted = final_score is not None and final_score >= score_threshold
+        _record_attempt(manifest, index, prompt, final, final_score, f"final render: {reason}", accepted,
+                        generation_seconds, time.perf_counter() - analysis_start)
+        if final_score is not None:
+            print(f"Scene {index + 1} final score: {final_score} ({reason})")
+        return (final, final_score) if accepted else None
+
+    def _render_final(self, draft, prompt: str, score: float, score_threshold: float, title: str, index: int,
+                      output_directory: Optional[str], manifest: Optional[RunManifest]):
+        """Blocking _final_steps, for the speculative path."""
+        steps = self._final_steps(draft, prompt, score, score_threshold, index, manifest)
+        return self._drive(steps, title, index, output_directory)
+
+    def _evaluate(self, title: str, image, prompt: str) -> Tuple[Optional[float], str]:
+        if self.score_batcher is not None:
+            return self.score_batcher.evaluate_image(image, prompt, group=title)
+        return self.image_analyzer.evaluate_image(image, prompt)
+
+    async def _evaluate_async(self, title: str, image, prompt: str) -> Tuple[Optional[float], str]:
+        if self.score_batcher is not None:
+            return await asyncio.to_thread(self.score_batcher.evaluate_image, image, prompt, title)
+        return await self.image_analyzer.evaluate_image_async(image, prompt)
+
+    def _duplicate_reason(self, image, title: str, index: int, ignore: Optional[str] = None) -> Optional[str]:
+        """Check the image against the dedupe index; returns a reason if it is a near-duplicate."""
+        if self.dedupe_index is None:
+            return None
+        with metrics.span("dedupe_check", scene=index + 1):
+            match = self.dedupe_index.check(image.data, image.path, title, ignore=ignore)
+            metrics.set_attrs(duplicate=match is not None)
+        if match is None:
+            return None
+        print(f"× Scene {index + 1} image is a near-duplicate of {match.image_path}")
+        return f"near-duplicate of {match.image_path} (distance {match.distance})"
+
+    def _scene_steps(self, title: str, index: int, prompt: str, score_threshold: float, max_retries: int,
+                     manifest: Optional[RunManifest], checkpoint: Optional[TitleCheckpoint]):
+        """The generate, score and retry loop for a single scene, written once for the blocking and async paths.
+        Each remote call is yielded as (operation, keyword arguments) and its result is sent back by
+        _drive or _drive_async. Every attempt is recorded in manifest and the loop state in checkpoint,
+        from which an interrupted scene picks up where it stopped. Returns the scene result."""
+        start = time.perf_counter()
+        retry_count, current_prompt, scene_images, reasons = _resume_scene(checkpoint, index, prompt)
+
+        while retry_count < max_retries:
+            _save_scene(checkpoint, index, retry_count, current_prompt, scene_images, reasons)
+            print(f"\nGenerating image for scene {index + 1} (Attempt {retry_count + 1}/{max_retries})...")
+            generation_start = time.perf_counter()
+            image = yield "generate", {"prompt": current_prompt, "tier": self._first_tier}
+            generation_seconds = time.perf_counter() - generation_start
+            duplicate = (yield "duplicate", {"image": image}) if image is not None else None
+
+            if duplicate is not None:
+                reasons.append(duplicate)
+                _record_attempt(manifest, index, current_prompt, image, None, duplicate, False, generation_seconds)
+                current_prompt = yield "regenerate", {"fresh": True}
+                retry_count += 1
+            elif image is not None:
+                image_path = image.path
+                scene_images.append(image_path)
+                analysis_start = time.perf_counter()
+                score, reason = yield "evaluate", {"image": image, "prompt": current_prompt}
+                reasons.append(reason)
+                _record_attempt(manifest, index, current_prompt, image, score, reason,
+                                score is not None and score >= score_threshold and not self.drafts,
+                                generation_seconds, time.perf_counter() - analysis_start)
+
+                if score is not None:
+                    print(f"Scene {index + 1} score: {score} ({reason})")
+
+                    if score >= score_threshold:
+                        accepted = yield from self._final_steps(image, current_prompt, score, score_threshold, index,
+                                                                manifest)
+                        if accepted is None:
+                            print("× Final render failed or was rejected. Retrying...")
                             retry_count += 1
+                            continue
+                        final, score = accepted
+                        if final is not image:
+                            scene_images.append(final.path)
+                        print(f"✓ Scene {index + 1} generated successfully with score: {score}")
+                        return _scene_result(index, (score, final.path, current_prompt), scene_images,
+                                             retry_count + 1, start, reasons)
                     else:
-                        print("× Failed to generate image. Retrying...")
+                        print(f"× Score too low ({score}). Generating new prompt...")
+                        # The cached alternative already failed once, so later retries sample a fresh prompt
+                        current_prompt = yield "regenerate", {"fresh": retry_count > 0}
                         retry_count += 1
-                    
-                    if not success and retry_count < max_retries:
-                        time.sleep(2)
-
-            if self.social_media and self.generated_images:
-                print("\nPublishing to Pinterest...")
-                if self.social_media.publish_to_pinterest(self.generated_images):
-                    logging.info("Successfully published to Pinterest")
                 else:
-                    logging.error("Failed to publish to Pinterest")
-            
-            return len(best_versions) > 0
+                    print("× Failed to get valid score. Retrying...")
+                    retry_count += 1
+            else:
+                print("× Failed to generate image. Retrying...")
+                reasons.append("image generation failed")
+                _record_attempt(manifest, index, current_prompt, None, None, "image generation failed", False,
+                                generation_seconds)
+                retry_count += 1
+
+        return _scene_result(index, None, scene_images, retry_count, start, reasons)
+
+    def _step(self, title: str, index: int, output_directory: Optional[str], operation: str, kwargs: dict):
+        """Carry out one operation yielded by _scene_steps with blocking calls."""
+        if operation == "generate":
+            return self.image_generator.generate_image_handle(kwargs["prompt"], index + 1, output_directory,
+                                                              seed=kwargs.get("seed"), tier=kwargs["tier"])
+        if operation == "duplicate":
+            return self._duplicate_reason(kwargs["image"], title, index, kwargs.get("ignore"))
+        if operation == "evaluate":
+            return self._evaluate(title, kwargs["image"], kwargs["prompt"])
+        return self.prompt_generator.regenerate_scene(title, index + 1, fresh=kwargs["fresh"])
+
+    async def _step_async(self, title: str, index: int, output_directory: Optional[str], operation: str,
+                          kwargs: dict):
+        """Async version of _step."""
+        if operation == "generate":
+            return await self.image_generator.generate_image_handle_async(kwargs["prompt"], index + 1,
+                                                                          output_directory, seed=kwargs.get("seed"),
+                                                                          tier=kwargs["tier"])
+        if operation == "duplicate":
+            return await asyncio.to_thread(self._duplicate_reason, kwargs["image"], title, index,
+                                           kwargs.get("ignore"))
+        if operation == "evaluate":
+            return await self._evaluate_async(title, kwargs["image"], kwargs["prompt"])
+        return await self.prompt_generator.regenerate_scene_async(title, index + 1, fresh=kwargs["fresh"])
+
+    def _drive(self, steps, title: str, index: int, output_directory: Optional[str]):
+        """Run a step generator to completion and return its result."""
+        try:
+            operation, kwargs = next(steps)
+            while True:
+                operation, kwargs = steps.send(self._step(title, index, output_directory, operation, kwargs))
+        except StopIteration as finished:
+            return finished.value
+
+    async def _drive_async(self, steps, title: str, index: int, output_directory: Optional[str]):
+        """Async version of _drive."""
+        try:
+            operation, kwargs = next(steps)
+            while True:
+                result = await self._step_async(title, index, output_directory, operation, kwargs)
+                operation, kwargs = steps.send(result)
+        except StopIteration as finished:
+            return finished.value
+
+    def _process_scene(self, title: str, index: int, prompt: str, score_threshold: float,
+                       max_retries: int, output_directory: Optional[str] = None,
+                       manifest: Optional[RunManifest] = None, checkpoint: Optional[TitleCheckpoint] = None) -> dict:
+        """Run the generate, score and retry loop for a single scene.
+        Returns a scene result with the accepted (score, image_path, prompt) under "best", or None."""
+        steps = self._scene_steps(title, index, prompt, score_threshold, max_retries, manifest, checkpoint)
+        return self._drive(steps, title, index, output_directory)
+
+    async def _process_scene_async(self, title: str, index: int, prompt: str, score_threshold: float,
+                                   max_retries: int, output_directory: Optional[str] = None,
+                                   manifest: Optional[RunManifest] = None,
+                                   checkpoint: Optional[TitleCheckpoint] = None) -> dict:
+        """Async version of _process_scene."""
+        steps = self._scene_steps(title, index, prompt, score_threshold, max_retries, manifest, checkpoint)
+        return await self._drive_async(steps, title, index, output_directory)
+
+    def _run_candidate(self, title: str, index: int, candidate_prompt: Optional[str], seed: Optional[int],
+                       regenerate_fresh: bool, output_directory: Optional[str],
+                       cancelled: threading.Event, report: dict, report_lock: threading.Lock):
+        """Generate and score one speculative candidate, skipping whatever is left once cancelled is set.
+        Returns (prompt, image, score, reason, generation seconds, analysis seconds), or None if skipped."""
+        if cancelled.is_set():
+            return None
+        if candidate_prompt is None:
+            candidate_prompt = self.prompt_generator.regenerate_scene(title, index + 1, fresh=regenerate_fresh)
+        generation_start = time.perf_counter()
+        image = self.image_generator.generate_image_handle(candidate_prompt, index + 1, output_directory, seed=seed,
+                                                           tier=self._first_tier)
+        generation_seconds = time.perf_counter() - generation_start
+        with report_lock:
+            report["generation_seconds"] += generation_seconds
+            report["generated"] += image is not None
+        if image is None:
+            return candidate_prompt, None, None, "image generation failed", generation_seconds, None
+        # Check for a cutoff before the dedupe index, which would otherwise keep a never-scored image forever
+        if cancelled.is_set():
+            # The file is left in place: names are content-addressed, so a winner with the same bytes may share it
+            with report_lock:
+                report["discarded"] += 1
+            return None
+        duplicate = self._duplicate_reason(image, title, index)
+        if duplicate is not None:
+            with report_lock:
+                report["duplicates"] += 1
+            return candidate_prompt, image, None, duplicate, generation_seconds, None
+
+        analysis_start = time.perf_counter()
+        score, reason = self._evaluate(title, image, candidate_prompt)
+        analysis_seconds = time.perf_counter() - analysis_start
+        with report_lock:
+            report["analysis_seconds"] += analysis_seconds
+            report["analyzed"] += 1
+        return candidate_prompt, image, score, reason, generation_seconds, analysis_seconds
+
+    def _process_scene_speculative(self, title: str, index: int, prompt: str, score_threshold: float,
+                                   max_retries: int, output_directory: Optional[str] = None,
+                                   manifest: Optional[RunManifest] = None,
+                                   checkpoint: Optional[TitleCheckpoint] = None) -> dict:
+        """Best-of-N version of _process_scene. Each round fires self.speculative candidates at once,
+        using alternate prompts from regenerate_scene and distinct seeds, scores them as they arrive
+        and cancels the rest as soon as one clears score_threshold."""
+        start = time.perf_counter()
+        first_round, current_prompt, scene_images, reasons = _resume_scene(checkpoint, index, prompt)
+        report = {"rounds": 0, "launched": 0, "generated": 0, "duplicates": 0, "analyzed": 0, "cancelled": 0,
+                  "discarded": 0, "generation_seconds": 0.0, "analysis_seconds": 0.0, "seconds_to_accept": None}
+        report_lock = threading.Lock()
+        base_seed = self.image_generator.seed
+        candidates = self.speculative
+
+        for round_number in range(first_round, max_retries):
+            _save_scene(checkpoint, index, round_number, current_prompt, scene_images, reasons)
+            print(f"\nGenerating {candidates} candidates for scene {index + 1} (Round {round_number + 1}/{max_retries})...")
+            report["rounds"] += 1
+            cancelled = threading.Event()
+            executor = ThreadPoolExecutor(max_workers=candidates)
+            futures = []
+            for k in range(candidates):
+                variant = round_number * candidates + k
+                futures.append(executor.submit(
+                    metrics.in_context(self._run_candidate), title, index,
+                    # None asks the candidate to fetch an alternate prompt concurrently with the others
+                    None if 0 < k <= self.speculative_prompts else current_prompt,
+                    None if base_seed is None else base_seed + variant,
+                    round_number > 0 or k > 1, output_directory, cancelled, report, report_lock
+                ))
+            with report_lock:
+                report["launched"] += candidates
+
+            winner = None
+            try:
+                for future in as_completed(futures):
+                    try:
+                        outcome = future.result()
+                    except Exception as e:
+                        logging.error(f"Scene {index + 1} candidate failed: {e}")
+                        continue
+                    if outcome is None:
+                        continue
+                    candidate_prompt, image, score, reason, generation_seconds, analysis_seconds = outcome
+                    reasons.append(reason)
+                    accepted = score is not None and score >= score_threshold
+                    _record_attempt(manifest, index, candidate_prompt, image, score, reason,
+                                    accepted and not self.drafts, generation_seconds, analysis_seconds)
+                    if image is None or analysis_seconds is None:
+                        continue
+                    scene_images.append(image.path)
+                    print(f"Scene {index + 1} candidate score: {score} ({reason})")
+                    if accepted:
+                        cancelled.set()
+                        with report_lock:
+                            report["cancelled"] += sum(f.cancel() for f in futures)
+                        accepted_final = self._render_final(image, candidate_prompt, score, score_threshold, title,
+                                                            index, output_directory, manifest)
+                        if accepted_final is not None:
+                            final, score = accepted_final
+                            if final is not image:
+                                scene_images.append(final.path)
+                            winner = (score, final.path, candidate_prompt)
+                            with report_lock:
+                                report["seconds_to_accept"] = round(time.perf_counter() - start, 3)
+                        break
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+            if winner is not None:
+                print(f"✓ Scene {index + 1} generated successfully with score: {winner[0]}")
+                with report_lock:
+                    snapshot = dict(report)
+                return _scene_result(index, winner, scene_images, snapshot["launched"], start, reasons, snapshot)
+
+            if round_number + 1 < max_retries:
+                print(f"× No candidate reached {score_threshold}. Generating new prompt...")
+                current_prompt = self.prompt_generator.regenerate_scene(title, index + 1, fresh=True)
+
+        with report_lock:
+            snapshot = dict(report)
+        return _scene_result(index, None, scene_images, snapshot["launched"], start, reasons, snapshot)
+
+    def run_title(self, title: str, max_iterations: int = 2, score_threshold: float = 8.39, max_retries: int = 3,
+                  output_directory: Optional[str] = None) -> dict:
+        """Generate and refine the scenes for one title and return a JSON-serialisable result
+        with per-scene scores, image paths and timings.
+        With max_workers > 1 each scene runs its retry loop on its own worker thread.
+        Every stage call is traced and the trace is written to trace.json in the output directory."""
+        with metrics.trace(title) as title_trace, self.image_analyzer.scoring_session(title):
+            result = self._run_title(title, max_iterations, score_threshold, max_retries, output_directory)
+        return _write_trace(result, title_trace)
+
+    def _open_title(self, title: str, output_directory: Optional[str]):
+        """Result, checkpoint and manifest for one run of title, resuming an unfinished earlier run.
+        Without an output_directory the title gets its own folder, so titles never share a checkpoint."""
+        result = _title_result(title, output_directory or own_title_directory(self.image_generator.output_directory,
+                                                                             title))
+        checkpoint = TitleCheckpoint(result["output_directory"], title, enabled=self.checkpoints)
+        manifest = RunManifest(result["output_directory"], title, run_id=checkpoint.run_id)
+        result["run_id"] = manifest.run_id
+        result["manifest_path"] = manifest.path
+        result["resumed"] = checkpoint.resumed
+        return result, checkpoint, manifest
+
+    def _collect_winners(self, title: str, result: dict, scene_results: List[dict], images_start: float,
+                         manifest: RunManifest) -> bool:
+        """Fold finished scenes into result, pick the winners and queue them for Pinterest.
+        Returns True if the winners still have to be published inline."""
+        _collect_scenes(result, scene_results)
+        result["timings"]["images"] = round(time.perf_counter() - images_start, 3)
+        # Only accepted attempts are kept and published; rejected retries stay in the manifest only
+        result["winners"] = [entry["image_path"] for entry in manifest.winners()]
+        with self._images_lock:
+            self.generated_images.extend(result["winners"])
+        if "speculation" in result:
+            logging.info(f"Speculation report for '{title}': {result['speculation']}")
+
+        if self.publisher and result["winners"]:
+            result["publish_queued"] = self.publisher.enqueue(result["winners"], title=title)
+            print(f"\nQueued {result['publish_queued']} images for Pinterest")
+            return False
+        return bool(self.social_media and result["winners"])
+
+    def _publish_winners(self, result: dict):
+        print("\nPublishing to Pinterest...")
+        publish_start = time.perf_counter()
+        result["published"] = self.social_media.publish_to_pinterest(result["winners"])
+        result["timings"]["publish"] = round(time.perf_counter() - publish_start, 3)
+        if result["published"]:
+            logging.info("Successfully published to Pinterest")
+        else:
+            logging.error("Failed to publish to Pinterest")
+
+    def _run_title(self, title: str, max_iterations: int, score_threshold: float, max_retries: int,
+                   output_directory: Optional[str]) -> dict:
+        print(f"\nGenerating concept art for: {title}")
+        start = time.perf_counter()
+        result, checkpoint, manifest = self._open_title(title, output_directory)
+        output_directory = result["output_directory"]
+
+        try:
+            scenes = checkpoint.scenes or self.prompt_generator.generate_scenes(title)
+            result["timings"]["scenes"] = round(time.perf_counter() - start, 3)
+            if not _valid_scenes(result, scenes):
+                return _finish(result, start)
+            checkpoint.set_scenes(scenes)
+
+            images_start = time.perf_counter()
+            scene_results = [None] * len(scenes)
+
+            process_scene = self._process_scene_speculative if self.speculative > 1 else self._process_scene
+
+            if self.max_workers > 1:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(scenes))) as executor:
+                    futures = {
+                        executor.submit(metrics.in_context(self._run_scene), process_scene, title, i, prompt,
+                                        score_threshold, max_retries, output_directory, manifest, checkpoint): i
+                        for i, prompt in enumerate(scenes)
+                    }
+                    for future in as_completed(futures):
+                        i = futures[future]
+                        try:
+                            scene_results[i] = future.result()
+                        except Exception as e:
+                            logging.error(f"Scene {i + 1} failed: {e}")
+                            scene_results[i] = _scene_result(i, None, [], 0, images_start)
+            else:
+                for i, prompt in enumerate(scenes):
+                    scene_results[i] = self._run_scene(process_scene, title, i, prompt, score_threshold, max_retries,
+                                                       output_directory, manifest, checkpoint)
+
+            if self._collect_winners(title, result, scene_results, images_start, manifest):
+                self._publish_winners(result)
+            checkpoint.finish()
 
         except Exception as e:
             logging.error(f"Error in process_title: {e}")
-            return False
+            result["error"] = str(e)
+            result["success"] = False
+
+        return _finish(result, start)
+
+    def process_title(self, title: str, max_iterations: int = 2, score_threshold: float = 8.39, max_retries: int = 3,
+                      output_directory: Optional[str] = None) -> bool:
+        """Main process to generate and refine scenes."""
+        return self.run_title(title, max_iterations, score_threshold, max_retries, output_directory)["success"]
+
+    async def run_title_async(self, title: str, max_iterations: int = 2, score_threshold: float = 8.39,
+                              max_retries: int = 3, output_directory: Optional[str] = None) -> dict:
+        """Async version of run_title. All scenes run concurrently on the shared HTTP session."""
+        with metrics.trace(title) as title_trace, self.image_analyzer.scoring_session(title):
+            result = await self._run_title_async(title, max_iterations, score_threshold, max_retries,
+                                                 output_directory)
+        return _write_trace(result, title_trace)
+
+    async def _run_title_async(self, title: str, max_iterations: int, score_threshold: float, max_retries: int,
+                               output_directory: Optional[str]) -> dict:
+        print(f"\nGenerating concept art for: {title}")
+        start = time.perf_counter()
+        result, checkpoint, manifest = self._open_title(title, output_directory)
+        output_directory = result["output_directory"]
+
+        try:
+            scenes = checkpoint.scenes or await self.prompt_generator.generate_scenes_async(title)
+            result["timings"]["scenes"] = round(time.perf_counter() - start, 3)
+            if not _valid_scenes(result, scenes):
+                return _finish(result, start)
+            checkpoint.set_scenes(scenes)
+
+            images_start = time.perf_counter()
+            gathered = await asyncio.gather(
+                *(self._run_scene_async(title, i, prompt, score_threshold, max_retries, output_directory, manifest,
+                                        checkpoint)
+                  for i, prompt in enumerate(scenes)),
+                return_exceptions=True
+            )
+
+            scene_results = []
+            for i, scene_result in enumerate(gathered):
+                if isinstance(scene_result, Exception):
+                    logging.error(f"Scene {i + 1} failed: {scene_result}")
+                    scene_result = _scene_result(i, None, [], 0, images_start)
+                scene_results.append(scene_result)
+
+            if self._collect_winners(title, result, scene_results, images_start, manifest):
+                # Pinterest client is blocking, keep it off the event loop
+                await asyncio.to_thread(self._publish_winners, result)
+            checkpoint.finish()
+
+        except Exception as e:
+            logging.error(f"Error in process_title: {e}")
+            result["error"] = str(e)
+            result["success"] = False
+
+        return _finish(result, start)
+
+    async def process_title_async(self, title: str, max_iterations: int = 2, score_threshold: float = 8.39,
+                                  max_retries: int = 3, output_directory: Optional[str] = None) -> bool:
+        """Async version of process_title."""
+        result = await self.run_title_async(title, max_iterations, score_threshold, max_retries, output_directory)
+        return result["success"]
+
+    def finish_publishing(self, timeout: Optional[float] = None) -> bool:
+        """Wait for queued Pinterest uploads, then stop the publisher workers.
+        Anything still pending after timeout stays in the queue for the next run."""
+        if self.publisher is None:
+            return True
+        drained = self.publisher.drain(timeout)
+        self.publisher.stop()
+        stats = self.publisher.queue.stats()
+        logging.info(f"Publish queue stats: {stats}")
+        for image_path, error in self.publisher.queue.failures():
+            logging.error(f"Gave up publishing {image_path}: {error}")
+        if not drained:
+            logging.warning(f"{stats['pending']} uploads still pending; they will resume on the next run")
+        return drained and stats["failed"] == 0
+
+    async def process_titles_async(self, titles: List[str], max_concurrent: int = 8, **kwargs) -> List[bool]:
+        """Run many titles in one event loop, at most max_concurrent at a time."""
+        semaphore = asyncio.Semaphore(max_concurrent)
+
+        async def run(title: str) -> bool:
+            async with semaphore:
+                return await self.process_title_async(title, **kwargs)
+
+        try:
+            return await asyncio.gather(*(run(title) for title in titles))
+        finally:
+            await self.http_client.close()
+
+
+def _scene_result(index: int, best: Optional[Tuple[float, str, str]], images: List[str], attempts: int,
+                  start: float, reasons: Optional[List[str]] = None, speculation: Optional[dict] = None) -> dict:
+    result = {
+        "scene": index + 1,
+        "best": best,
+        "images": images,
+        "attempts": attempts,
+        "reasons": reasons or [],
+        "seconds": round(time.perf_counter() - start, 3)
+    }
+    if speculation is not None:
+        speculation["generation_seconds"] = round(speculation["generation_seconds"], 3)
+        speculation["analysis_seconds"] = round(speculation["analysis_seconds"], 3)
+        result["speculation"] = speculation
+    return result
 
-def main():
+
+def _resume_scene(checkpoint: Optional[TitleCheckpoint], index: int, prompt: str):
+    """(retry count, current prompt, images, reasons) saved for the scene, or a fresh start."""
+    progress = checkpoint.progress(index) if checkpoint is not None else None
+    if progress is None:
+        return 0, prompt, [], []
+    print(f"Resuming scene {index + 1} at attempt {progress['retry_count'] + 1}")
+    return progress["retry_count"], progress["prompt"], progress["images"], progress["reasons"]
+
+
+def _save_scene(checkpoint: Optional[TitleCheckpoint], index: int, retry_count: int, prompt: str,
+                images: List[str], reasons: List[str]):
+    if checkpoint is not None:
+        checkpoint.save_progress(index, retry_count=retry_count, prompt=prompt, images=images, reasons=reasons)
+
+
+def _record_attempt(manifest: Optional[RunManifest], index: int, prompt: str, image, score: Optional[float],
+                    reason: str, accepted: bool, generation_seconds: Optional[float] = None,
+                    analysis_seconds: Optional[float] = None):
+    if manifest is not None:
+        manifest.record(index + 1, prompt, image, score, reason, accepted, generation_seconds, analysis_seconds)
+
+
+def _valid_scenes(result: dict, scenes: Optional[List[str]]) -> bool:
+    if not scenes or len(scenes) < 6:
+        logging.error("Failed to generate valid scenes")
+        result["error"] = "Failed to generate valid scenes"
+        return False
+    return True
+
+
+def _title_result(title: str, output_directory: str) -> dict:
+    return {
+        "title": title,
+        "success": False,
+        "output_directory": output_directory,
+        "scenes": [],
+        "images": [],
+        "winners": [],
+        "timings": {}
+    }
+
+
+def _collect_scenes(result: dict, scene_results: List[dict]):
+    """Fold per-scene results into the title result in scene order; best_versions is keyed by scene index."""
+    best_versions = {}
+    for i, scene in enumerate(scene_results):
+        result["images"].extend(scene["images"])
+        best = scene["best"]
+        if best is not None:
+            best_versions[i] = best
+        result["scenes"].append({
+            "scene": scene["scene"],
+            "score": best[0] if best else None,
+            "image_path": best[1] if best else None,
+            "prompt": best[2] if best else None,
+            "attempts": scene["attempts"],
+            "reasons": scene["reasons"],
+            "images": scene["images"],
+            "seconds": scene["seconds"]
+        })
+        if "speculation" in scene:
+            result["scenes"][-1]["speculation"] = scene["speculation"]
+            _add_speculation(result, scene["speculation"])
+    result["success"] = len(best_versions) > 0
+
+
+def _add_speculation(result: dict, speculation: dict):
+    """Sum per-scene best-of-N counters into a per-title cost/latency report."""
+    totals = result.setdefault("speculation", {})
+    for key, value in speculation.items():
+        if key == "seconds_to_accept":
+            if value is not None:
+                totals["max_seconds_to_accept"] = max(totals.get("max_seconds_to_accept", 0), value)
+            continue
+        totals[key] = round(totals.get(key, 0) + value, 3)
+
+
+def _finish(result: dict, start: float) -> dict:
+    result["timings"]["total"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def _write_trace(result: dict, title_trace: metrics.Trace) -> dict:
+    """Save the title's spans next to its images so slow runs can be inspected afterwards."""
+    trace_path = os.path.join(result["output_directory"], "trace.json")
+    try:
+        os.makedirs(result["output_directory"], exist_ok=True)
+        title_trace.write(trace_path)
+        result["trace_path"] = trace_path
+    except Exception as e:
+        logging.error(f"Failed to write trace for '{result['title']}': {e}")
+    return result
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate concept art scenes for one title or a batch of titles.")
+    parser.add_argument('--batch', metavar='PATH',
+                        help="Read titles from PATH ('-' for stdin), one per line or as JSONL with a 'title' field")
+    parser.add_argument('--concurrency', type=int, default=4, help="Titles in flight at once in batch and serve mode")
+    parser.add_argument('--output', default='batch_results.jsonl',
+                        help="Where batch mode writes one JSON result per title ('-' for stdout)")
+    parser.add_argument('--serve', action='store_true',
+                        help="Run as a long-lived service taking titles over a local HTTP API instead of prompting")
+    parser.add_argument('--host', default='127.0.0.1', help="Address the service listens on")
+    parser.add_argument('--port', type=int, default=8765, help="Port the service listens on")
+    parser.add_argument('--queue-size', type=int, default=16,
+                        help="Titles the service holds waiting before it answers 429")
+    parser.add_argument('--workers', type=int, default=int(os.getenv('SCENE_WORKERS', '1')),
+                        help="Scenes processed concurrently per title")
+    parser.add_argument('--speculative', type=int, default=1,
+                        help="Candidates generated at once per scene; the first to clear the threshold wins")
+    parser.add_argument('--speculative-prompts', type=int, default=None,
+                        help="How many speculative candidates use alternate prompts instead of new seeds")
+    parser.add_argument('--backend', choices=['cloudflare', 'local'], default='cloudflare',
+                        help="Image backend; 'local' renders deterministic placeholder images offline")
+    parser.add_argument('--drafts', action='store_true',
+                        help="Score a low-resolution, few-step draft first and render only passing drafts in full")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Pin the Flux seed so repeated prompts hit the image cache")
+    parser.add_argument('--cache-dir', default=os.getenv('IMAGE_CACHE_DIR'),
+                        help="Enable the on-disk image cache in this directory")
+    parser.add_argument('--cache-size-mb', type=int, default=512, help="Image cache size limit before LRU eviction")
+    parser.add_argument('--prompt-cache', default=os.getenv('PROMPT_CACHE_PATH'),
+                        help="SQLite file memoizing Llama scene prompts")
+    parser.add_argument('--prompt-cache-ttl-hours', type=float, default=168, help="Prompt cache entry lifetime")
+    parser.add_argument('--prompt-cache-size', type=int, default=10000, help="Prompt cache entry limit")
+    parser.add_argument('--fresh-prompts', action='store_true',
+                        help="Always sample new prompts from Llama; responses are still cached")
+    parser.add_argument('--no-prefilter', action='store_true',
+                        help="Send every image to Pixtral instead of rejecting broken ones locally first")
+    parser.add_argument('--upload-max-side', type=int, default=None,
+                        help="Downscale images to this many pixels on the long side before sending them to Pixtral")
+    parser.add_argument('--upload-jpeg-quality', type=int, default=None,
+                        help="Re-encode images as JPEG at this quality before sending them to Pixtral")
+    parser.add_argument('--score-batch', type=int, default=1,
+                        help="Score up to this many images per Pixtral request when scenes or candidates finish together")
+    parser.add_argument('--score-batch-wait', type=float, default=0.05,
+                        help="Seconds an image waits for others to join its scoring batch")
+    parser.add_argument('--score-jitter', action='store_true',
+                        help="Nudge a score that nearly ties the previous one by up to 0.2")
+    parser.add_argument('--score-seed', type=int, default=None,
+                        help="Seed the score jitter so reruns of a title get the same scores")
+    parser.add_argument('--profile', action='store_true',
+                        help="Print p50/p95/p99 latency per pipeline stage when the run finishes")
+    parser.add_argument('--metrics-file', metavar='PATH',
+                        help="Write per-stage latency, retry and payload metrics to PATH in Prometheus text format")
+    parser.add_argument('--publish-queue', default=os.getenv('PUBLISH_QUEUE_PATH', 'publish_queue.sqlite3'),
+                        help="SQLite file tracking Pinterest uploads so they run in the background and resume after a restart")
+    parser.add_argument('--no-publish-queue', action='store_true',
+                        help="Publish inline at the end of each title instead of through the queue")
+    parser.add_argument('--publish-workers', type=int, default=2, help="Concurrent Pinterest upload workers")
+    parser.add_argument('--publish-timeout', type=float, default=600,
+                        help="Seconds to wait for queued uploads before exiting; the rest resume next run")
+    parser.add_argument('--publish-pending', action='store_true',
+                        help="Only resume uploads left in the publish queue (including failed ones), then exit")
+    parser.add_argument('--no-checkpoint', action='store_true',
+                        help="Don't save per-title progress; by default an interrupted title resumes where it stopped")
+    parser.add_argument('--dedupe-index', default=os.getenv('DEDUPE_INDEX_PATH'),
+                        help="SQLite perceptual-hash index; near-duplicates of earlier images skip scoring and publishing")
+    parser.add_argument('--dedupe-distance', type=int, default=6,
+                        help="Max Hamming distance between 64-bit pHashes to count as a near-duplicate")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
     try:
         load_dotenv()
-        user_input = input("Enter a high-level description for your scenes: ").strip()
+        args = parse_args(argv)
         cloudflare_account_id = os.getenv('CLOUDFLARE_ACCOUNT_ID')
         cloudflare_api_token = os.getenv('CLOUDFLARE_API_TOKEN')
         pinterest_email = os.getenv('PINTEREST_EMAIL')
         pinterest_password = os.getenv('PINTEREST_PASSWORD')
         mistral_api_key = os.getenv('MISTRAL_API_KEY')
+        image_cache = ImageCache(args.cache_dir, max_bytes=args.cache_size_mb * 1024 * 1024) if args.cache_dir else None
+        prompt_cache = PromptCache(args.prompt_cache, ttl_seconds=args.prompt_cache_ttl_hours * 3600,
+                                   max_entries=args.prompt_cache_size) if args.prompt_cache else None
+        prefilter = None
+        if not args.no_prefilter:
+            from image_quality import ImagePrefilter
+            prefilter = ImagePrefilter()
+        dedupe_index = None
+        if args.dedupe_index:
+            from dedupe_index import DedupeIndex
+            dedupe_index = DedupeIndex(args.dedupe_index, max_distance=args.dedupe_distance)
+        # Only a Pinterest login starts a publisher, so only then is the queue file opened
+        publish_queue = None
+        if pinterest_email and pinterest_password and not args.no_publish_queue:
+            publish_queue = PublishQueue(args.publish_queue)
+        if publish_queue is not None and args.publish_pending:
+            publish_queue.retry_failed()
+        interactive = not args.batch and not args.publish_pending and not args.serve
+        user_input = input("Enter a high-level description for your scenes: ").strip() if interactive else None
         generator = SceneImageGenerator(
             cloudflare_account_id=cloudflare_account_id,
             cloudflare_api_token=cloudflare_api_token,
             pinterest_email=pinterest_email,
             pinterest_password=pinterest_password,
-            mistral_api_key=mistral_api_key
+            mistral_api_key=mistral_api_key,
+            max_workers=args.workers,
+            image_cache=image_cache,
+            seed=args.seed,
+            prompt_cache=prompt_cache,
+            fresh_prompts=args.fresh_prompts,
+            prefilter=prefilter,
+            upload_max_side=args.upload_max_side,
+            upload_jpeg_quality=args.upload_jpeg_quality,
+            speculative=args.speculative,
+            speculative_prompts=args.speculative_prompts,
+            cloudflare_api_base=os.getenv('CLOUDFLARE_API_BASE'),
+            mistral_server_url=os.getenv('MISTRAL_SERVER_URL'),
+            publish_queue=publish_queue,
+            publish_workers=args.publish_workers,
+            dedupe_index=dedupe_index,
+            checkpoints=not args.no_checkpoint,
+            score_batch=args.score_batch,
+            score_batch_wait=args.score_batch_wait,
+            score_jitter=args.score_jitter,
+            score_seed=args.score_seed,
+            image_backend=LocalBackend() if args.backend == 'local' else None,
+            drafts=args.drafts
         )
-        
-        success = generator.process_title(user_input)
-        
-        if success:
-            logging.info("Scene generation and publishing completed successfully")
+
+        if args.publish_pending:
+            if generator.publisher is None:
+                logging.error("Nothing to resume: Pinterest credentials or the publish queue are not configured")
+        elif args.serve:
+            from service import serve
+            serve(generator, args.host, args.port, workers=args.concurrency, queue_size=args.queue_size)
+        elif args.batch:
+            input_stream = sys.stdin if args.batch == '-' else open(args.batch, encoding='utf-8')
+            output_stream = sys.stdout if args.output == '-' else open(args.output, 'a', encoding='utf-8')
+            try:
+                succeeded, failed = run_batch(generator, read_titles(input_stream), output_stream,
+                                              concurrency=args.concurrency,
+                                              output_root=generator.image_generator.output_directory)
+            finally:
+                if input_stream is not sys.stdin:
+                    input_stream.close()
+                if output_stream is not sys.stdout:
+                    output_stream.close()
+            if failed:
+                logging.error(f"{failed} of {succeeded + failed} titles failed")
         else:
-            logging.error("Failed to complete the process")
+            success = generator.process_title(user_input)
+
+            if success:
+                logging.info("Scene generation and publishing completed successfully")
+            else:
+                logging.error("Failed to complete the process")
+
+        if generator.publisher is not None:
+            print("\nWaiting for queued Pinterest uploads...")
+            if generator.finish_publishing(args.publish_timeout):
+                logging.info("All queued images published to Pinterest")
+        if publish_queue:
+            publish_queue.close()
+        if image_cache:
+            logging.info(f"Image cache stats: {image_cache.stats()}")
+        if prompt_cache:
+            logging.info(f"Prompt cache stats: {prompt_cache.stats()}")
+        if dedupe_index:
+            logging.info(f"Dedupe index stats: {dedupe_index.stats()}")
+        if args.profile:
+            print("\n" + metrics.REGISTRY.summary_table())
+        if args.metrics_file:
+            with open(args.metrics_file, 'w', encoding='utf-8') as f:
+                f.write(metrics.REGISTRY.prometheus_text())
             
     except Exception as e:
         logging.error(f"Unexpected error in main process: {e}")
@@ -0,0 +1,87 @@
+import os
+import re
+import json
+import hashlib
+import queue
+import logging
+import threading
+from typing import IO, Iterable, Iterator, Tuple
+
+_SENTINEL = object()
+
+
+def read_titles(stream: IO[str]) -> Iterator[str]:
+    """Yield titles from plain text (one per line) or JSONL ({"title": ...} per line)."""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('{'):
+            try:
+                title = json.loads(line).get('title')
+            except json.JSONDecodeError as e:
+                logging.error(f"Skipping malformed JSONL line: {e}")
+                continue
+            if title:
+                yield str(title).strip()
+            else:
+                logging.error(f"Skipping JSONL line without a title: {line}")
+        else:
+            yield line
+
+
+def _slug(title: str) -> str:
+    return re.sub(r'[^a-z0-9]+', '-', title.lower()).strip('-')[:50] or 'title'
+
+
+def title_directory(output_root: str, index: int, title: str) -> str:
+    """Per-title output folder, unique even when two titles slugify the same way."""
+    return os.path.join(output_root, f"{index:05d}_{_slug(title)}")
+
+
+def own_title_directory(output_root: str, title: str) -> str:
+    """Output folder for a title run on its own. It depends only on the title, so a rerun finds the
+    title's checkpoint and different titles never share one."""
+    digest = hashlib.sha256(title.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(output_root, f"{_slug(title)}_{digest}")
+
+
+def run_batch(generator, titles: Iterable[str], output_stream: IO[str], concurrency: int = 4,
+              output_root: str = "generated_images", **kwargs) -> Tuple[int, int]:
+    """Run generator.run_title across a bounded worker pool.
+    Writes one JSON result per title to output_stream as titles finish and returns (succeeded, failed)."""
+    concurrency = max(1, concurrency)
+    jobs = queue.Queue(maxsize=concurrency * 2)
+    output_lock = threading.Lock()
+    counts = {'succeeded': 0, 'failed': 0}
+
+    def worker():
+        while True:
+            job = jobs.get()
+            if job is _SENTINEL:
+                return
+            index, title = job
+            try:
+                result = generator.run_title(title, output_directory=title_directory(output_root, index, title), **kwargs)
+            except Exception as e:
+                logging.error(f"Error processing title '{title}': {e}")
+                result = {'title': title, 'success': False, 'error': str(e)}
+            result['index'] = index
+            with output_lock:
+                counts['succeeded' if result.get('success') else 'failed'] += 1
+                output_stream.write(json.dumps(result) + "\n")
+                output_stream.flush()
+
+    workers = [threading.Thread(target=worker, name=f"batch-worker-{i}", daemon=True) for i in range(concurrency)]
+    for thread in workers:
+        thread.start()
+
+    for index, title in enumerate(titles):
+        jobs.put((index, title))
+    for _ in workers:
+        jobs.put(_SENTINEL)
+    for thread in workers:
+        thread.join()
+
+    logging.info(f"Batch finished: {counts['succeeded']} succeeded, {counts['failed']} failed")
+    return counts['succeeded'], counts['failed']
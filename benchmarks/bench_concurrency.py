@@ -0,0 +1,42 @@
+"""Compare serial, concurrent and speculative process_title wall-clock time with stubbed clients.
+
+Usage: python benchmarks/bench_concurrency.py [--workers 6] [--speculative 3] [--generation-latency 0.5]
+"""
+import argparse
+import logging
+import time
+
+from stubs import make_generator
+
+
+def run(max_workers: int, generation_latency: float, analysis_latency: float, prompt_latency: float,
+        speculative: int = 1):
+    generator = make_generator(max_workers, generation_latency, analysis_latency, prompt_latency, speculative)
+    start = time.perf_counter()
+    result = generator.run_title("Benchmark Title")
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=6)
+    parser.add_argument("--generation-latency", type=float, default=0.5)
+    parser.add_argument("--analysis-latency", type=float, default=0.3)
+    parser.add_argument("--prompt-latency", type=float, default=0.2)
+    parser.add_argument("--speculative", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    latencies = (args.generation_latency, args.analysis_latency, args.prompt_latency)
+    serial, _ = run(1, *latencies)
+    concurrent, _ = run(args.workers, *latencies)
+    speculative, result = run(args.workers, *latencies, speculative=args.speculative)
+
+    print(f"\nserial:      {serial:.2f}s")
+    print(f"concurrent:  {concurrent:.2f}s ({args.workers} workers, {serial / concurrent:.2f}x)")
+    print(f"speculative: {speculative:.2f}s ({args.speculative} candidates per scene, {serial / speculative:.2f}x)")
+    print(f"speculation report: {result.get('speculation')}")
+
+
+if __name__ == "__main__":
+    main()
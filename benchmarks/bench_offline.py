@@ -0,0 +1,216 @@
+"""End-to-end throughput benchmark against local fake Cloudflare, Mistral and Pinterest servers.
+
+Drives the real clients over HTTP, so connection pooling, streaming decode, retries and
+publishing are all exercised without spending API credits. For each concurrency level it runs
+the single-title path (scene workers = level) and the batch path (titles in flight = level),
+and reports titles/min, p50/p95 title latency, per-stage p95, peak RSS and bytes transferred.
+
+Usage: python benchmarks/bench_offline.py [--titles 8] [--levels 1 2 4] [--error-rate 0.05]
+                                          [--output bench_results.json] [--baseline old.json]
+"""
+import io
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+import contextlib
+from typing import List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_servers import FakeAPIServer, FakePinterestClient, ServiceProfile
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RSSSampler:
+    """Samples resident memory in the background and keeps the peak seen during one run."""
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "RSSSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_generator(server: FakeAPIServer, workers: int, speculative: int, output_directory: str,
+                   score_batch: int = 1):
+    """A real SceneImageGenerator whose clients point at the fake server."""
+    from app import SceneImageGenerator
+    from image_quality import ImagePrefilter
+    from social_media import SocialMediaManager
+
+    generator = SceneImageGenerator("bench-account", "bench-token", mistral_api_key="bench-key",
+                                    max_workers=workers, speculative=speculative, prefilter=ImagePrefilter(),
+                                    score_batch=score_batch,
+                                    cloudflare_api_base=server.cloudflare_api_base, mistral_server_url=server.url)
+    generator.image_generator.output_directory = output_directory
+    generator.social_media = SocialMediaManager(boards_url=server.boards_url, client=FakePinterestClient(server.url))
+    return generator
+
+
+def run_level(server: FakeAPIServer, mode: str, level: int, titles: List[str], workers: int,
+              speculative: int, score_batch: int = 1) -> dict:
+    import metrics
+    from batch import run_batch
+
+    output_root = tempfile.mkdtemp(prefix=f"bench_{mode}_{level}_")
+    generator = make_generator(server, level if mode == "title" else workers, speculative, output_root,
+                               score_batch)
+    server.reset_stats()
+    metrics.REGISTRY.reset()
+    results = []
+
+    with RSSSampler() as rss, open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        if mode == "title":
+            for i, title in enumerate(titles):
+                results.append(generator.run_title(title, output_directory=os.path.join(output_root, str(i))))
+        else:
+            output = io.StringIO()
+            run_batch(generator, titles, output, concurrency=level, output_root=output_root)
+            results = [json.loads(line) for line in output.getvalue().splitlines()]
+        elapsed = time.perf_counter() - start
+
+    latencies = [r["timings"]["total"] for r in results if "timings" in r]
+    traffic = server.stats()
+    return {
+        "mode": mode,
+        "level": level,
+        "titles": len(titles),
+        "succeeded": sum(1 for r in results if r.get("success")),
+        "published": sum(1 for r in results if r.get("published")),
+        "seconds": round(elapsed, 3),
+        "titles_per_min": round(len(titles) / elapsed * 60, 2),
+        "p50_seconds": _percentile(latencies, 0.5),
+        "p95_seconds": _percentile(latencies, 0.95),
+        "stage_p95_seconds": {stage: round(stats["p95"], 3) for stage, stats in metrics.REGISTRY.quantiles().items()},
+        "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+        "bytes_sent": sum(s["bytes_in"] for s in traffic.values()),
+        "bytes_received": sum(s["bytes_out"] for s in traffic.values()),
+        "services": traffic
+    }
+
+
+def compare(runs: List[dict], baseline: dict, tolerance: float) -> List[str]:
+    """Runs whose throughput dropped or p95 grew by more than tolerance against the baseline file."""
+    previous = {(run["mode"], run["level"]): run for run in baseline.get("runs", [])}
+    regressions = []
+    for run in runs:
+        old = previous.get((run["mode"], run["level"]))
+        if old is None:
+            continue
+        if run["titles_per_min"] < old["titles_per_min"] * (1 - tolerance):
+            regressions.append(f"{run['mode']} x{run['level']}: titles/min {old['titles_per_min']} -> "
+                               f"{run['titles_per_min']}")
+        if old["p95_seconds"] and run["p95_seconds"] and run["p95_seconds"] > old["p95_seconds"] * (1 + tolerance):
+            regressions.append(f"{run['mode']} x{run['level']}: p95 {old['p95_seconds']}s -> {run['p95_seconds']}s")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--titles", type=int, default=8, help="Titles per run")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4], help="Concurrency levels to sweep")
+    parser.add_argument("--modes", nargs="+", choices=["title", "batch"], default=["title", "batch"])
+    parser.add_argument("--workers", type=int, default=6, help="Scene workers per title in batch mode")
+    parser.add_argument("--speculative", type=int, default=1)
+    parser.add_argument("--score-batch", type=int, default=1, help="Images scored per Pixtral request")
+    parser.add_argument("--llama-latency", type=float, default=0.2)
+    parser.add_argument("--flux-latency", type=float, default=0.5)
+    parser.add_argument("--pixtral-latency", type=float, default=0.4)
+    parser.add_argument("--pinterest-latency", type=float, default=0.1)
+    parser.add_argument("--jitter", type=float, default=0.1, help="Uniform +/- jitter added to every latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429/503")
+    parser.add_argument("--image-size", type=int, nargs=2, default=[512, 288], metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--min-score", type=float, default=6.5)
+    parser.add_argument("--max-score", type=float, default=9.5)
+    parser.add_argument("--keep-rate-limits", action="store_true",
+                        help="Keep the production per-service rate limits instead of lifting them")
+    parser.add_argument("--output", default="bench_results.json", help="Where to save the JSON report")
+    parser.add_argument("--baseline", help="Earlier JSON report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown before flagging a regression")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.CRITICAL)
+    from rate_limiter import DEFAULT_LIMITS, configure_endpoint
+    for name in DEFAULT_LIMITS:
+        if args.keep_rate_limits:
+            configure_endpoint(name, base_delay=0.05)
+        else:
+            configure_endpoint(name, rate=1000.0, burst=1000, base_delay=0.05)
+
+    latencies = {"llama": args.llama_latency, "flux": args.flux_latency,
+                 "pixtral": args.pixtral_latency, "pinterest": args.pinterest_latency}
+    profiles = {name: ServiceProfile(latency, args.jitter, args.error_rate) for name, latency in latencies.items()}
+    titles = [f"Benchmark product {i + 1}" for i in range(args.titles)]
+
+    runs = []
+    with FakeAPIServer(profiles, image_size=tuple(args.image_size),
+                       score_range=(args.min_score, args.max_score)) as server:
+        for mode in args.modes:
+            for level in args.levels:
+                run = run_level(server, mode, level, titles, args.workers, args.speculative, args.score_batch)
+                runs.append(run)
+                print(f"{mode:<6} x{level:<3} {run['titles_per_min']:>8.2f} titles/min  "
+                      f"p95 {run['p95_seconds']}s  peak RSS {run['peak_rss_mb']} MB  "
+                      f"sent {run['bytes_sent'] / 2 ** 20:.1f} MB  received {run['bytes_received'] / 2 ** 20:.1f} MB  "
+                      f"({run['succeeded']}/{run['titles']} succeeded)")
+
+    report = {"commit": _git_commit(), "created": time.time(), "config": vars(args), "runs": runs}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(runs, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"× Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("✓ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
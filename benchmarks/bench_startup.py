@@ -0,0 +1,94 @@
+"""Startup benchmark: how long a fresh interpreter takes to import app, print --help and build a
+SceneImageGenerator, and which heavy modules are loaded by then. Each measurement runs in its own
+subprocess so nothing is already imported.
+
+Usage: python benchmarks/bench_startup.py [--repeat 5] [--top 10] [--max-import-ms 300]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that should only load once a run actually needs them
+HEAVY_MODULES = ["mistralai", "py3pin", "aiohttp", "httpx", "requests", "urllib3", "numpy"]
+
+CONSTRUCT = f"""
+import sys, json, time
+start = time.perf_counter()
+from app import SceneImageGenerator
+imported = time.perf_counter()
+SceneImageGenerator("bench-account", "bench-token", pinterest_email="bench@example.com",
+                    pinterest_password="bench", mistral_api_key="bench-key")
+built = time.perf_counter()
+print(json.dumps({{"import": imported - start, "construct": built - imported,
+                  "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def _python(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, text=True, check=True)
+
+
+def wall_time(args: List[str], repeat: int) -> float:
+    """Median seconds for a fresh interpreter to run args, interpreter startup included."""
+    times = []
+    for _ in range(repeat):
+        result = _python("-c", "import time, subprocess, sys; s = time.perf_counter(); "
+                               f"subprocess.run([sys.executable, *{args!r}], capture_output=True); "
+                               "print(time.perf_counter() - s)")
+        times.append(float(result.stdout))
+    return statistics.median(times)
+
+
+def import_profile(top: int) -> List[Tuple[str, float]]:
+    """Slowest modules imported by app (cumulative ms), from python -X importtime."""
+    result = _python("-X", "importtime", "-c", "import app")
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = max(modules.get(name.strip(), 0), int(cumulative) / 1000)
+    modules.pop("app", None)
+    return sorted(modules.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement; the median is reported")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    parser.add_argument("--max-import-ms", type=float, default=None,
+                        help="Exit 1 if importing app takes longer than this")
+    args = parser.parse_args()
+
+    baseline = wall_time(["-c", "pass"], args.repeat)
+    import_seconds = wall_time(["-c", "import app"], args.repeat)
+    help_seconds = wall_time(["app.py", "--help"], args.repeat)
+    constructed = [json.loads(_python("-c", CONSTRUCT).stdout.splitlines()[-1]) for _ in range(args.repeat)]
+
+    import_ms = (import_seconds - baseline) * 1000
+    print(f"interpreter:        {baseline * 1000:7.1f} ms")
+    print(f"import app:         {import_ms:7.1f} ms (on top of the interpreter)")
+    print(f"app.py --help:      {(help_seconds - baseline) * 1000:7.1f} ms")
+    print(f"generator init:     {statistics.median(c['construct'] for c in constructed) * 1000:7.1f} ms")
+    loaded = constructed[-1]["loaded"]
+    print(f"heavy modules loaded after construction: {', '.join(loaded) if loaded else 'none'}")
+    print("\nslowest imports (cumulative):")
+    for name, ms in import_profile(args.top):
+        print(f"  {ms:7.1f} ms  {name}")
+
+    if args.max_import_ms is not None:
+        if import_ms > args.max_import_ms:
+            print(f"× import app took {import_ms:.1f} ms, budget is {args.max_import_ms:.0f} ms")
+            sys.exit(1)
+        print(f"✓ import app within {args.max_import_ms:.0f} ms budget")
+
+
+if __name__ == "__main__":
+    main()
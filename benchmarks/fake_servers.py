@@ -0,0 +1,231 @@
+"""Local stand-ins for the Workers AI, Mistral and Pinterest HTTP APIs, for offline benchmarks.
+
+FakeAPIServer answers on one port:
+  POST /client/v4/accounts/<id>/ai/run/@cf/meta/...               -> {"result": {"response": ...}}
+  POST /client/v4/accounts/<id>/ai/run/@cf/black-forest-labs/...  -> {"result": {"image": <base64 png>}}
+  POST /v1/chat/completions                                        -> Mistral chat completion
+  GET  /resource/BoardsResource/get/                               -> Pinterest board list
+  POST /upload-image/, /resource/PinResource/create/               -> Pinterest upload flow
+"""
+import io
+import json
+import time
+import base64
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import requests
+from PIL import Image
+
+SERVICES = ("llama", "flux", "pixtral", "pinterest")
+
+
+class ServiceProfile:
+    """Latency, jitter and error rate of one fake service. Errors alternate between 429 and 503."""
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+
+def _noise_png(width: int, height: int, seed: int) -> bytes:
+    """Smooth gradient plus noise: passes the local prefilter and varies per seed so it isn't a duplicate."""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, width)[None, :, None]
+    y = np.linspace(0, 1, height)[:, None, None]
+    base = 60 + 120 * (x * rng.random(3) + y * rng.random(3))
+    pixels = np.clip(base + rng.normal(0, 25, (height, width, 3)), 0, 255).astype(np.uint8)
+    out = io.BytesIO()
+    Image.fromarray(pixels, "RGB").save(out, format="PNG")
+    return out.getvalue()
+
+
+class FakeAPIServer:
+    def __init__(self, profiles: Optional[Dict[str, ServiceProfile]] = None, image_size: Tuple[int, int] = (512, 288),
+                 image_variants: int = 8, score_range: Tuple[float, float] = (6.5, 9.5), seed: int = 0):
+        self.profiles = {name: ServiceProfile() for name in SERVICES}
+        self.profiles.update(profiles or {})
+        self.score_range = score_range
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.images = [base64.b64encode(_noise_png(*image_size, seed + i)).decode("ascii")
+                       for i in range(image_variants)]
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def cloudflare_api_base(self) -> str:
+        return f"{self.url}/client/v4"
+
+    @property
+    def boards_url(self) -> str:
+        return f"{self.url}/resource/BoardsResource/get/"
+
+    def start(self) -> "FakeAPIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeAPIServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = {name: {"requests": 0, "errors": 0, "bytes_in": 0, "bytes_out": 0} for name in SERVICES}
+
+    def stats(self) -> Dict[str, dict]:
+        with self._stats_lock:
+            return {name: dict(counts) for name, counts in self._stats.items()}
+
+    def _record(self, service: str, bytes_in: int, bytes_out: int, error: bool):
+        with self._stats_lock:
+            counts = self._stats[service]
+            counts["requests"] += 1
+            counts["errors"] += int(error)
+            counts["bytes_in"] += bytes_in
+            counts["bytes_out"] += bytes_out
+
+    def _draw(self) -> float:
+        with self._random_lock:
+            return self._random.random()
+
+    def _delay_and_fail(self, service: str) -> Optional[int]:
+        """Sleep for the service's latency; return an error status if this request should fail."""
+        profile = self.profiles[service]
+        roll = self._draw()
+        time.sleep(max(0.0, profile.latency + profile.jitter * (2 * self._draw() - 1)))
+        if roll < profile.error_rate:
+            return 429 if roll < profile.error_rate / 2 else 503
+        return None
+
+    def _llama_response(self, body: dict) -> dict:
+        system = body["messages"][0]["content"] if body.get("messages") else ""
+        if "Scene number:" in system:
+            text = "Retake: product on a marble table with soft window light and shallow depth of field"
+        else:
+            text = "\n".join(f"Scene {i + 1}: product on a clean surface, angle {i + 1}, natural light"
+                             for i in range(6))
+        return {"result": {"response": text}, "success": True, "errors": [], "messages": []}
+
+    def _flux_response(self) -> dict:
+        image = self.images[int(self._draw() * len(self.images))]
+        return {"result": {"image": image}, "success": True, "errors": [], "messages": []}
+
+    def _pixtral_response(self, body: dict) -> dict:
+        low, high = self.score_range
+        messages = body.get("messages") or [{}]
+        images = sum(1 for part in messages[-1].get("content") or []
+                     if isinstance(part, dict) and part.get("type") == "image_url")
+        scores = "\n".join(f"Image {number}: {round(low + (high - low) * self._draw(), 1)}"
+                           for number in range(1, max(1, images) + 1))
+        return {
+            "id": "fake-chat",
+            "object": "chat.completion",
+            "model": "pixtral-12b-2409",
+            "created": int(time.time()),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant",
+                            "content": f"1. Clean composition.\n2. Good lighting, slight noise.\nSCORES\n{scores}\nEND"},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 1000, "completion_tokens": 30, "total_tokens": 1030}
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _service(self) -> Optional[str]:
+                if "/ai/run/" in self.path:
+                    return "flux" if "black-forest-labs" in self.path else "llama"
+                if self.path.startswith("/v1/chat/completions"):
+                    return "pixtral"
+                if self.path.startswith(("/resource/", "/upload-image")):
+                    return "pinterest"
+                return None
+
+            def _send(self, status: int, payload: dict, service: Optional[str], bytes_in: int):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                if status == 429:
+                    self.send_header("Retry-After", "0")
+                self.end_headers()
+                self.wfile.write(body)
+                if service is not None:
+                    server._record(service, bytes_in, len(body), status >= 400)
+
+            def _handle(self, body: bytes):
+                service = self._service()
+                if service is None:
+                    self._send(404, {"error": "not found"}, None, len(body))
+                    return
+                error = server._delay_and_fail(service)
+                if error is not None:
+                    self._send(error, {"error": "injected failure"}, service, len(body))
+                    return
+                if service == "llama":
+                    payload = server._llama_response(json.loads(body or b"{}"))
+                elif service == "flux":
+                    payload = server._flux_response()
+                elif service == "pixtral":
+                    payload = server._pixtral_response(json.loads(body or b"{}"))
+                elif self.path.startswith("/resource/BoardsResource"):
+                    payload = {"resource_response": {"data": [{"name": "AI", "id": "1000"}]}}
+                elif self.path.startswith("/upload-image"):
+                    payload = {"success": True, "image_url": f"{server.url}/images/{int(time.time() * 1000)}.png"}
+                else:
+                    payload = {"resource_response": {"data": {"id": str(int(time.time() * 1000))}}}
+                self._send(200, payload, service, len(body))
+
+            def do_GET(self):
+                self._handle(b"")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                self._handle(self.rfile.read(length))
+
+        return Handler
+
+
+class FakePinterestClient:
+    """Drop-in for the py3pin session used by SocialMediaManager: uploads the image, then creates the pin."""
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    def upload_pin(self, board_id: str, image_file: str, description: str = "", title: str = ""):
+        with open(image_file, "rb") as f:
+            upload = requests.post(f"{self.base_url}/upload-image/", files={"img": f}, timeout=30)
+        if upload.status_code != 200:
+            return upload
+        return requests.post(f"{self.base_url}/resource/PinResource/create/", timeout=30, json={
+            "board_id": board_id,
+            "image_url": upload.json()["image_url"],
+            "description": description,
+            "title": title
+        })
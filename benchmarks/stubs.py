@@ -0,0 +1,81 @@
+"""Stand-in clients with injected latency for offline benchmarks."""
+import os
+import sys
+import time
+import random
+import hashlib
+import tempfile
+import contextlib
+from typing import List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_handle import ImageHandle
+
+
+class StubPromptGenerator:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def generate_scenes(self, title: str, fresh: bool = False) -> List[str]:
+        time.sleep(self.latency)
+        return [f"Scene {i + 1}: {title} with natural lighting" for i in range(6)]
+
+    def regenerate_scene(self, title: str, scene_number: int, fresh: bool = False) -> str:
+        time.sleep(self.latency)
+        return f"Scene {scene_number}: {title} retake with soft light"
+
+
+class StubImageGenerator:
+    def __init__(self, latency: float = 0.0, output_directory: Optional[str] = None):
+        self.latency = latency
+        self.output_directory = output_directory or tempfile.mkdtemp(prefix="bench_images_")
+        self.seed = None
+
+    def generate_image_handle(self, prompt: str, image_number: int, output_directory: Optional[str] = None,
+                              seed: Optional[int] = None, tier: str = "final") -> Optional[ImageHandle]:
+        time.sleep(self.latency)
+        output_directory = output_directory or self.output_directory
+        os.makedirs(output_directory, exist_ok=True)
+        seed = seed if seed is not None else random.randint(1, 1000000)
+        data = f"{prompt} {seed} {tier}".encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        image_path = os.path.join(output_directory, f"scene_{image_number}_{digest[:16]}.png")
+        with open(image_path, "wb") as f:
+            f.write(data)
+        return ImageHandle(image_path, data, prompt=prompt, seed=seed, sha256=digest)
+
+    def generate_image(self, prompt: str, image_number: int, output_directory: Optional[str] = None) -> Optional[str]:
+        image = self.generate_image_handle(prompt, image_number, output_directory)
+        return image.path if image else None
+
+
+class StubImageAnalyzer:
+    """Scores are derived from the prompt so runs are repeatable: retakes always pass."""
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def analyze_image(self, image, original_prompt: str) -> Optional[float]:
+        time.sleep(self.latency)
+        if "retake" in original_prompt:
+            return 9.0
+        digest = hashlib.sha256(original_prompt.encode("utf-8")).digest()
+        return 7.0 + (digest[0] % 30) / 10
+
+    def evaluate_image(self, image, original_prompt: str) -> Tuple[Optional[float], str]:
+        return self.analyze_image(image, original_prompt), "stub score"
+
+    def scoring_session(self, name: str):
+        return contextlib.nullcontext()
+
+
+def make_generator(max_workers: int = 1, generation_latency: float = 0.0,
+                   analysis_latency: float = 0.0, prompt_latency: float = 0.0, speculative: int = 1):
+    """Build a SceneImageGenerator whose remote clients are replaced with stubs."""
+    from app import SceneImageGenerator
+
+    generator = SceneImageGenerator("bench-account", "bench-token", max_workers=max_workers, speculative=speculative)
+    generator.prompt_generator = StubPromptGenerator(prompt_latency)
+    generator.image_generator = StubImageGenerator(generation_latency)
+    generator.image_analyzer = StubImageAnalyzer(analysis_latency)
+    return generator
@@ -0,0 +1,90 @@
+import os
+import json
+import uuid
+import logging
+import threading
+from typing import List, Optional
+
+CHECKPOINT_NAME = "checkpoint.json"
+
+
+class TitleCheckpoint:
+    """Progress of one title saved to checkpoint.json in its output directory after every step:
+    the generated scene list, each scene's retry state and the results of finished scenes.
+    An unfinished checkpoint for the same title is resumed; a finished or foreign one starts over.
+    Writes go through a temp file and rename, so a crash never leaves a torn checkpoint."""
+    def __init__(self, output_directory: str, title: str, enabled: bool = True):
+        self.path = os.path.join(output_directory, CHECKPOINT_NAME)
+        self.enabled = enabled
+        self.resumed = False
+        self._lock = threading.Lock()
+        self.state = None
+        if enabled:
+            self.state = self._load(title)
+        if self.state is None:
+            self.state = {"title": title, "run_id": uuid.uuid4().hex[:12], "scenes": None,
+                          "progress": {}, "completed": {}, "finished": False}
+
+    def _load(self, title: str) -> Optional[dict]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logging.error(f"Ignoring unreadable checkpoint {self.path}: {e}")
+            return None
+        if state.get("title") != title or state.get("finished"):
+            return None
+        self.resumed = True
+        logging.info(f"Resuming '{title}' from {self.path}: {len(state['completed'])} scenes already done")
+        return state
+
+    def _save(self):
+        if not self.enabled:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(temp_path, self.path)
+
+    @property
+    def run_id(self) -> str:
+        return self.state["run_id"]
+
+    @property
+    def scenes(self) -> Optional[List[str]]:
+        return self.state["scenes"]
+
+    def set_scenes(self, scenes: List[str]):
+        with self._lock:
+            self.state["scenes"] = scenes
+            self._save()
+
+    def progress(self, index: int) -> Optional[dict]:
+        """Saved retry state of an unfinished scene, or None to start it from the beginning."""
+        with self._lock:
+            progress = self.state["progress"].get(str(index))
+            return dict(progress) if progress else None
+
+    def save_progress(self, index: int, **progress):
+        with self._lock:
+            self.state["progress"][str(index)] = progress
+            self._save()
+
+    def completed(self, index: int) -> Optional[dict]:
+        with self._lock:
+            return self.state["completed"].get(str(index))
+
+    def complete(self, index: int, scene_result: dict):
+        with self._lock:
+            self.state["completed"][str(index)] = scene_result
+            self.state["progress"].pop(str(index), None)
+            self._save()
+
+    def finish(self):
+        """Mark the title done so the next run of it starts fresh."""
+        with self._lock:
+            self.state["finished"] = True
+            self._save()
@@ -0,0 +1,177 @@
+import io
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+from PIL import Image
+
+HASH_BITS = 64
+
+
+def _gray(image: Union[str, bytes], size: Tuple[int, int]) -> np.ndarray:
+    source = io.BytesIO(image) if isinstance(image, bytes) else image
+    with Image.open(source) as img:
+        return np.asarray(img.convert("L").resize(size, Image.LANCZOS), dtype=np.float64)
+
+
+def _to_int(bits: np.ndarray) -> int:
+    value = 0
+    for bit in bits.ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+
+_DCT = np.cos(np.pi / 64 * np.outer(np.arange(32), 2 * np.arange(32) + 1))
+
+
+def phash(image: Union[str, bytes]) -> int:
+    """64-bit perceptual hash: sign of the low 8x8 DCT frequencies of a 32x32 thumbnail against their median."""
+    low = (_DCT @ _gray(image, (32, 32)) @ _DCT.T)[:8, :8].ravel()
+    return _to_int(low > np.median(low[1:]))
+
+
+def dhash(image: Union[str, bytes]) -> int:
+    """64-bit difference hash: whether each pixel of a 9x8 thumbnail is brighter than its right neighbour."""
+    gray = _gray(image, (9, 8))
+    return _to_int(gray[:, 1:] > gray[:, :-1])
+
+
+HASHERS = {"phash": phash, "dhash": dhash}
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class HammingIndex:
+    """Multi-index hashing over 64-bit hashes split into four 16-bit chunks. Two hashes within
+    radius r differ by at most r // 4 bits in at least one chunk, so a search only probes the
+    chunk values within that distance and checks the few candidates they hold.
+    Lookups stay well under a millisecond at hundreds of thousands of entries."""
+    CHUNKS = 4
+    CHUNK_BITS = HASH_BITS // CHUNKS
+
+    def __init__(self):
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(self.CHUNKS)]
+        self._hashes: Dict[int, int] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self._hashes)
+
+    def _chunks(self, value: int) -> List[int]:
+        mask = (1 << self.CHUNK_BITS) - 1
+        return [(value >> (i * self.CHUNK_BITS)) & mask for i in range(self.CHUNKS)]
+
+    def _neighbours(self, chunk: int, radius: int) -> List[int]:
+        values = [chunk]
+        for _ in range(radius):
+            values = list({v ^ (1 << bit) for v in values for bit in range(self.CHUNK_BITS)} | set(values))
+        return values
+
+    def add(self, value: int, item_id: int):
+        self._hashes[item_id] = value
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            table.setdefault(chunk, []).append(item_id)
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, int]]:
+        """All (distance, item id) pairs within radius of value, nearest first."""
+        candidates = set()
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            for neighbour in self._neighbours(chunk, radius // self.CHUNKS):
+                candidates.update(table.get(neighbour, ()))
+        matches = []
+        for item_id in candidates:
+            distance = hamming(value, self._hashes[item_id])
+            if distance <= radius:
+                matches.append((distance, item_id))
+        return sorted(matches)
+
+
+class DuplicateMatch:
+    def __init__(self, image_path: str, title: Optional[str], distance: int):
+        self.image_path = image_path
+        self.title = title
+        self.distance = distance
+
+    def __repr__(self):
+        return f"DuplicateMatch({self.image_path!r}, distance={self.distance})"
+
+
+class DedupeIndex:
+    """Persistent perceptual-hash index of every generated image, across titles and runs.
+    Hashes live in SQLite and are loaded into an in-memory HammingIndex for distance lookups."""
+    def __init__(self, path: str = "dedupe_index.sqlite3", max_distance: int = 6, method: str = "phash"):
+        if method not in HASHERS:
+            raise ValueError(f"Unknown hash method {method!r}, expected one of {sorted(HASHERS)}")
+        self.path = path
+        self.max_distance = max_distance
+        self.method = method
+        self.hasher = HASHERS[method]
+        self.checks = 0
+        self.duplicates = 0
+        self.hashes = HammingIndex()
+        self._entries: Dict[int, Tuple[str, Optional[str]]] = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS image_hashes ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " method TEXT NOT NULL,"
+            " hash INTEGER NOT NULL,"
+            " image_path TEXT NOT NULL,"
+            " title TEXT,"
+            " created REAL NOT NULL)"
+        )
+        self._conn.commit()
+        start = time.perf_counter()
+        for item_id, value, image_path, title in self._conn.execute(
+                "SELECT id, hash, image_path, title FROM image_hashes WHERE method = ?", (method,)):
+            self._entries[item_id] = (image_path, title)
+            self.hashes.add(value & (2 ** HASH_BITS - 1), item_id)
+        logging.info(f"Loaded {self.hashes.size} image hashes in {time.perf_counter() - start:.2f}s")
+
+    def check(self, image: Union[str, bytes], image_path: str, title: Optional[str] = None,
+              ignore: Optional[str] = None) -> Optional[DuplicateMatch]:
+        """Return the nearest earlier image within max_distance, or index this one and return None.
+        Near-duplicates are not indexed themselves, so the index keeps one entry per distinct frame.
+        A match on the image at path ignore, e.g. the draft a final render was made from, does not count."""
+        try:
+            value = self.hasher(image)
+        except Exception as e:
+            logging.error(f"Could not hash {image_path}: {e}")
+            return None
+        with self._lock:
+            self.checks += 1
+            matches = [match for match in self.hashes.search(value, self.max_distance)
+                       if ignore is None or self._entries[match[1]][0] != ignore]
+            if matches:
+                self.duplicates += 1
+                distance, item_id = matches[0]
+                return DuplicateMatch(*self._entries[item_id], distance)
+            # SQLite integers are signed 64-bit
+            signed = value - 2 ** HASH_BITS if value >= 2 ** (HASH_BITS - 1) else value
+            cursor = self._conn.execute(
+                "INSERT INTO image_hashes (method, hash, image_path, title, created) VALUES (?, ?, ?, ?, ?)",
+                (self.method, signed, image_path, title, time.time())
+            )
+            self._conn.commit()
+            self._entries[cursor.lastrowid] = (image_path, title)
+            self.hashes.add(value, cursor.lastrowid)
+            return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": self.hashes.size,
+                "checks": self.checks,
+                "duplicates": self.duplicates,
+                "duplicate_rate": round(self.duplicates / self.checks, 3) if self.checks else 0.0
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
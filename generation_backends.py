@@ -0,0 +1,206 @@
+import io
+import re
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+from http_client import CLOUDFLARE_API_BASE, AsyncHTTPClient, get_session
+from rate_limiter import RemoteEndpoint, get_endpoint
+import metrics
+
+STREAM_CHUNK_SIZE = 64 * 1024
+FLUX_SCHNELL = "@cf/black-forest-labs/flux-1-schnell"
+
+
+class GenerationTier:
+    """Model and render parameters one request is sent with."""
+    def __init__(self, name: str, model: str = FLUX_SCHNELL, width: int = 1280, height: int = 720,
+                 num_steps: int = 15, guidance_scale: float = 7.5):
+        self.name = name
+        self.model = model
+        self.width = width
+        self.height = height
+        self.num_steps = num_steps
+        self.guidance_scale = guidance_scale
+
+    def __repr__(self):
+        return f"GenerationTier({self.name!r}, {self.model!r}, {self.width}x{self.height}, steps={self.num_steps})"
+
+
+# A few-step draft for screening and the full render that gets published. The draft keeps the final
+# size: the seed only fixes the starting noise for a given resolution, so a smaller draft would
+# not preview the final image at all
+DEFAULT_TIERS: Dict[str, GenerationTier] = {
+    "draft": GenerationTier("draft", num_steps=4),
+    "final": GenerationTier("final"),
+}
+
+
+class ImageStreamDecoder:
+    """Incrementally pulls result.image out of a Workers AI JSON response and base64-decodes it
+    as chunks arrive, so neither the raw body nor the full base64 string is held in memory."""
+    _IMAGE_KEY = re.compile(rb'"image"\s*:\s*"')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Discard anything decoded so far, e.g. before a retried request."""
+        self._buffer = b""
+        self._pending = b""
+        self._in_image = False
+        self.done = False
+        self.image = bytearray()
+
+    def feed(self, chunk: bytes):
+        if self.done:
+            return
+        if not self._in_image:
+            self._buffer += chunk
+            match = self._IMAGE_KEY.search(self._buffer)
+            if not match:
+                # keep only enough of the tail to match a key split across chunks
+                self._buffer = self._buffer[-32:]
+                return
+            chunk = self._buffer[match.end():]
+            self._buffer = b""
+            self._in_image = True
+
+        end = chunk.find(b'"')
+        if end != -1:
+            chunk = chunk[:end]
+            self.done = True
+        data = self._pending + chunk
+        # JSON may escape "/" as "\/"; hold back a trailing backslash until the next chunk
+        held = b""
+        if not self.done and data.endswith(b"\\"):
+            data, held = data[:-1], b"\\"
+        data = data.replace(b"\\/", b"/")
+        usable = len(data) if self.done else len(data) - len(data) % 4
+        if usable:
+            self.image += base64.b64decode(data[:usable])
+        self._pending = data[usable:] + held
+
+    def result(self) -> Optional[bytes]:
+        return bytes(self.image) if self.done and self.image else None
+
+
+class GenerationBackend(ABC):
+    """Renders the payload ImageGenerator builds for a tier and returns the image bytes, or None on failure.
+    Failures are logged and recorded on the current span; they are not raised."""
+    name = "base"
+    # Longest prompt the backend's models accept; ImageGenerator truncates to it once
+    max_prompt_length = 2048
+
+    @abstractmethod
+    def generate(self, payload: dict, model: str) -> Optional[bytes]:
+        ...
+
+    async def generate_async(self, payload: dict, model: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self.generate, payload, model)
+
+
+class CloudflareBackend(GenerationBackend):
+    """Workers AI text-to-image models, streamed and decoded as the response arrives."""
+    name = "cloudflare"
+
+    def __init__(self, cloudflare_account_id: str, cloudflare_api_token: str, api_base: Optional[str] = None,
+                 http_client: Optional[AsyncHTTPClient] = None, endpoint: Optional[RemoteEndpoint] = None):
+        api_base = (api_base or CLOUDFLARE_API_BASE).rstrip("/")
+        self.models_url = f"{api_base}/accounts/{cloudflare_account_id}/ai/run"
+        self.api_token = cloudflare_api_token
+        self.http_client = http_client or AsyncHTTPClient()
+        self.endpoint = endpoint or get_endpoint("flux")
+
+    def url(self, model: str) -> str:
+        return f"{self.models_url}/{model}"
+
+    def _result(self, decoder: ImageStreamDecoder) -> Optional[bytes]:
+        image_data = decoder.result()
+        if image_data is None:
+            logging.error("Image generation response did not contain an image")
+            metrics.set_attrs(status="empty")
+            return None
+        metrics.set_attrs(response_bytes=len(image_data))
+        return image_data
+
+    def generate(self, payload: dict, model: str) -> Optional[bytes]:
+        response = self.endpoint.call(lambda: get_session().post(
+            self.url(model),
+            headers={"Authorization": f"Bearer {self.api_token}"},
+            verify=False,
+            json=payload,
+            timeout=30,
+            stream=True
+        ))
+
+        metrics.set_attrs(status=response.status_code)
+        with response:
+            if response.status_code == 200:
+                decoder = ImageStreamDecoder()
+                for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                    decoder.feed(chunk)
+                return self._result(decoder)
+            else:
+                logging.error(f"Image generation failed: {response.status_code} - {response.text}")
+                return None
+
+    async def generate_async(self, payload: dict, model: str) -> Optional[bytes]:
+        decoder = ImageStreamDecoder()
+
+        def attempt():
+            decoder.reset()
+            return self.http_client.post_stream(
+                self.url(model),
+                headers={"Authorization": f"Bearer {self.api_token}"},
+                payload=payload,
+                on_chunk=decoder.feed,
+                timeout=30,
+                chunk_size=STREAM_CHUNK_SIZE
+            )
+
+        response = await self.endpoint.call_async(attempt)
+        metrics.set_attrs(status=response.status_code)
+
+        if response.status_code == 200:
+            return self._result(decoder)
+        else:
+            logging.error(f"Image generation failed: {response.status_code} - {response.text}")
+            return None
+
+
+class LocalBackend(GenerationBackend):
+    """Offline, deterministic renderer for tests and dry runs: the same payload and model always give
+    the same PNG, a gradient plus noise that passes the local prefilter. Like a real model, the
+    composition depends on prompt, seed and size but not on num_steps, so a draft previews its final.
+    seconds_per_megapixel_step simulates render time that grows with resolution and steps."""
+    name = "local"
+
+    def __init__(self, seconds_per_megapixel_step: float = 0.0):
+        self.seconds_per_megapixel_step = seconds_per_megapixel_step
+
+    def generate(self, payload: dict, model: str) -> Optional[bytes]:
+        import numpy as np
+        from PIL import Image
+
+        width, height = payload.get("width", 1280), payload.get("height", 720)
+        steps = payload.get("num_steps", 15)
+        if self.seconds_per_megapixel_step:
+            time.sleep(self.seconds_per_megapixel_step * width * height / 1e6 * steps)
+        composition = {key: value for key, value in payload.items() if key != "num_steps"}
+        material = json.dumps({"payload": composition, "model": model}, sort_keys=True).encode("utf-8")
+        rng = np.random.default_rng(int.from_bytes(hashlib.sha256(material).digest()[:8], "big"))
+        x = np.linspace(0, 1, width)[None, :, None]
+        y = np.linspace(0, 1, height)[:, None, None]
+        base = 60 + 120 * (x * rng.random(3) + y * rng.random(3))
+        # Fewer steps leave more noise on the same composition
+        noise = rng.normal(0, 1, (height, width, 3)) * (15 + 40 / max(1, steps))
+        pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+        out = io.BytesIO()
+        Image.fromarray(pixels, "RGB").save(out, format="PNG")
+        metrics.set_attrs(response_bytes=out.tell())
+        return out.getvalue()
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
+
+# requests and aiohttp are imported on first use; together they are a large share of CLI startup time
+if TYPE_CHECKING:
+    import aiohttp
+    import requests
+
+DEFAULT_POOL_SIZE = 32
+CLOUDFLARE_API_BASE = "https://api.cloudflare.com/client/v4"
+
+_session: Optional["requests.Session"] = None
+_session_lock = threading.Lock()
+
+
+def get_session(pool_size: int = DEFAULT_POOL_SIZE) -> "requests.Session":
+    """Return the process-wide requests session so sync calls reuse pooled keep-alive connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            import urllib3
+            from requests.adapters import HTTPAdapter
+            # The Cloudflare clients post with verify=False
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+class HTTPResponse:
+    """Minimal response object shared by the async client, shaped like requests.Response."""
+    def __init__(self, status_code: int, headers: Dict[str, str], content: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+
+class AsyncHTTPClient:
+    """One pooled aiohttp session with a bounded connection limit, shared by every async client."""
+    def __init__(self, limit: int = DEFAULT_POOL_SIZE, limit_per_host: int = 0):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        import aiohttp
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            # aiohttp sessions are bound to the loop that created them
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host, ssl=False)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._loop = loop
+        return self._session
+
+    async def post(self, url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                   timeout: Optional[float] = 30) -> HTTPResponse:
+        import aiohttp
+        session = self._get_session()
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        async with session.post(url, headers=headers, json=payload, timeout=client_timeout) as response:
+            content = await response.read()
+            return HTTPResponse(response.status, dict(response.headers), content)
+
+    async def post_stream(self, url: str, headers: Dict[str, str], payload: Dict[str, Any],
+                          on_chunk: Callable[[bytes], None], timeout: Optional[float] = 30,
+                          chunk_size: int = 64 * 1024) -> HTTPResponse:
+        """POST and hand a 200 body to on_chunk piece by piece instead of buffering it.
+        Error bodies are read whole so callers can log them; the returned content is empty on success."""
+        import aiohttp
+        session = self._get_session()
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        async with session.post(url, headers=headers, json=payload, timeout=client_timeout) as response:
+            if response.status != 200:
+                return HTTPResponse(response.status, dict(response.headers), await response.read())
+            async for chunk in response.content.iter_chunked(chunk_size):
+                on_chunk(chunk)
+            return HTTPResponse(response.status, dict(response.headers), b"")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed and self._loop is asyncio.get_running_loop():
+            await self._session.close()
+        self._session = None
+        self._loop = None
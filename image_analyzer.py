@@ -1,19 +1,123 @@
-import base64
+import asyncio
 import logging
 import re
 import random
-from mistralai import Mistral
-from typing import Optional, Union
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Deque, Dict, Iterator, List, Optional, Tuple, Union
+from image_handle import ImageHandle
+from rate_limiter import RemoteEndpoint, get_endpoint
+import metrics
+
+# image_quality pulls in NumPy; it is only needed once a prefilter is passed in
+if TYPE_CHECKING:
+    from image_quality import ImagePrefilter, QualityReport
+
+SCORE_BLOCK = re.compile(r"SCORES:?\s*(.*?)\bEND\b", re.DOTALL)
+SCORE_LINE = re.compile(r"Image\s*(\d+)\s*:\s*(\d+(?:\.\d+)?)")
+FINAL_SCORE = re.compile(r"Final Score:\s*(\d+(?:\.\d+)?)")
+
+
+def parse_score_block(response: str, count: int) -> Optional[List[float]]:
+    """Scores from the last SCORES ... END block in image order, or None unless every image got one."""
+    blocks = SCORE_BLOCK.findall(response)
+    if not blocks:
+        return None
+    scores = {int(number): float(score) for number, score in SCORE_LINE.findall(blocks[-1])}
+    if sorted(scores) != list(range(1, count + 1)):
+        return None
+    return [scores[number] for number in range(1, count + 1)]
+
+
+class ScoringSession:
+    """Score context of one title: its most recent scores, shown to Pixtral and used to nudge ties apart.
+    History is a bounded ring buffer behind a lock, so scene threads and async tasks can share a session.
+    Jitter is off unless asked for, and drawn from a seeded generator when it is on."""
+    def __init__(self, history: int = 8, jitter: bool = False, seed: Optional[Union[int, str]] = None):
+        self.scores: Deque[float] = deque(maxlen=history)
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def recent(self, count: int = 3) -> List[float]:
+        with self._lock:
+            return list(self.scores)[-count:]
+
+    def record(self, score: float) -> float:
+        """Clamp the score to 0-10, optionally jitter it away from the previous one, and remember it."""
+        with self._lock:
+            score = min(max(score, 0), 10)
+            if self.jitter and self.scores and abs(self.scores[-1] - score) < 0.3:
+                score += self._random.uniform(-0.2, 0.2)
+                score = min(max(score, 0), 10)
+            score = round(score, 1)
+            self.scores.append(score)
+            return score
+
+
+_current_session: ContextVar[Optional[ScoringSession]] = ContextVar("scoring_session", default=None)
+
 
 class ImageAnalyzer:
-    def __init__(self, mistral_api_key: str):
-        self.client = Mistral(api_key=mistral_api_key)
-        self.previous_scores = [] 
-    def analyze_image(self, image_path: str, original_prompt: str) -> Optional[float]:
-        """Analyzes the image using the Pixtral model with context.
-        Returns a float score between 0-10 or None if analysis fails."""
-        
-        system_instructions = f"""You are an expert image quality analyzer. Evaluate the provided image and assign a score from 0-10.
+    def __init__(self, mistral_api_key: str, prefilter: Optional["ImagePrefilter"] = None,
+                 upload_max_side: Optional[int] = None, upload_jpeg_quality: Optional[int] = None,
+                 endpoint: Optional[RemoteEndpoint] = None, server_url: Optional[str] = None, batch_size: int = 4,
+                 history: int = 8, jitter: bool = False, jitter_seed: Optional[int] = None):
+        # The Mistral SDK is slow to import, so the client is built on the first Pixtral call
+        self.mistral_api_key = mistral_api_key
+        self.server_url = server_url
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.endpoint = endpoint or get_endpoint("pixtral")
+        self.prefilter = prefilter
+        # Optional downscale / JPEG re-encode before upload to cut request size
+        self.upload_max_side = upload_max_side
+        self.upload_jpeg_quality = upload_jpeg_quality
+        # Most images evaluate_images packs into one Pixtral request
+        self.batch_size = max(1, batch_size)
+        # Scores are kept per scoring_session(); calls outside one share this process-wide session
+        self.history = history
+        self.jitter = jitter
+        self.jitter_seed = jitter_seed
+        self.default_session = ScoringSession(history, jitter, jitter_seed)
+
+    @property
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                from mistralai import Mistral
+                self._client = Mistral(api_key=self.mistral_api_key, server_url=self.server_url)
+            return self._client
+
+    @contextmanager
+    def scoring_session(self, name: str) -> Iterator[ScoringSession]:
+        """Score everything in this context, including worker threads started via metrics.in_context
+        and tasks created inside it, against a fresh session. With a jitter seed, a session's jitter
+        depends only on the seed and its name."""
+        seed = None if self.jitter_seed is None else f"{self.jitter_seed}:{name}"
+        session = ScoringSession(self.history, self.jitter, seed)
+        token = _current_session.set(session)
+        try:
+            yield session
+        finally:
+            _current_session.reset(token)
+
+    @property
+    def session(self) -> ScoringSession:
+        return _current_session.get() or self.default_session
+
+    @property
+    def previous_scores(self) -> List[float]:
+        return self.session.recent(self.history)
+
+    def _build_messages(self, images: List[Tuple[str, str]]) -> list:
+        """Chat messages scoring each (data url, original prompt) pair, all in one request."""
+        previous_scores = self.session.recent(3)
+        example = "\n".join(f"Image {number}: [0-10]" for number in range(1, len(images) + 1))
+        system_instructions = f"""You are an expert image quality analyzer. Evaluate each provided image on its own and assign it a score from 0-10.
 
 Key Scoring Guidelines:
 1. Use the FULL range from 0-10, where:
@@ -31,90 +135,303 @@ Key Scoring Guidelines:
    - Consider small details that could push score higher or lower
    - Use decimals for fine-grained scoring
    
-Previous scores for context: {self.previous_scores[-3:] if self.previous_scores else 'None'}
+Previous scores for context: {previous_scores if previous_scores else 'None'}
 
 Provide your analysis in this format:
 1. Brief quality assessment
 2. Key strengths and weaknesses
-3. Final Score: [0-10]
+3. A final score block, one line per image, exactly like this:
+SCORES
+{example}
+END
 """
+        if len(images) == 1:
+            content = [{"type": "text", "text": f"Analyze this image. Original prompt: {images[0][1]}"}]
+        else:
+            content = [{"type": "text", "text": f"Analyze these {len(images)} images and score each one separately."}]
+        for number, (image_url, original_prompt) in enumerate(images, 1):
+            if len(images) > 1:
+                content.append({"type": "text", "text": f"Image {number}. Original prompt: {original_prompt}"})
+            content.append({"type": "image_url", "image_url": image_url})
+        return [
+            {
+                "role": "system",
+                "content": system_instructions
+            },
+            {
+                "role": "user",
+                "content": content
+            }
+        ]
 
-        def encode_image(image_path: str) -> Optional[str]:
-            try:
-                with open(image_path, "rb") as image_file:
-                    return base64.b64encode(image_file.read()).decode('utf-8')
-            except FileNotFoundError:
-                logging.error(f"Error: The file {image_path} was not found.")
-                return None
-            except Exception as e:
-                logging.error(f"Error: {e}")
-                return None
-
-        def extract_score(response: str) -> Optional[float]:
-            try:
-                logging.info(f"Raw response: {response}")
-                score_pattern = r"Final Score:\s*(\d+(?:\.\d+)?)"
-                match = re.search(score_pattern, response)
-                
-                if not match:
-                    match = re.search(r"\b\d+(\.\d+)?\b", response)
-                
-                if match:
-                    score = float(match.group(1) if match.group(1) else match.group(0))
-                    score = min(max(score, 0), 10)  
-                    if self.previous_scores and abs(self.previous_scores[-1] - score) < 0.3:
-                        score += random.uniform(-0.2, 0.2)
-                        score = min(max(score, 0), 10)  
-                    
-                    return round(score, 1)
-                return None
-            except Exception as e:
-                logging.error(f"Error parsing score: {e}")
-                return None
-
-        base64_image = encode_image(image_path)
-        if base64_image is None:
-            logging.error("Image encoding failed")
+    def _load_image(self, image: Union[str, ImageHandle]) -> Optional[ImageHandle]:
+        """Wrap a file path in a handle; handles from ImageGenerator already carry their bytes."""
+        if isinstance(image, ImageHandle):
+            return image
+        try:
+            return ImageHandle.from_path(image)
+        except FileNotFoundError:
+            logging.error(f"Error: The file {image} was not found.")
+            return None
+        except Exception as e:
+            logging.error(f"Error: {e}")
             return None
 
+    def _encode_image(self, image: ImageHandle) -> Optional[str]:
         try:
-            messages = [
-                {
-                    "role": "system",
-                    "content": system_instructions
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": f"Analyze this image. Original prompt: {original_prompt}"
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": f"data:image/jpeg;base64,{base64_image}"
-                        }
-                    ]
-                }
-            ]
-
-            chat_response = self.client.chat.complete(
-                model="pixtral-12b-2409",
-                messages=messages,
-                temperature=0.7
-            )
-            
-            response_text = chat_response.choices[0].message.content
-            # logging.info('Response from Pixtral: %s', response_text)
-            
-            score = extract_score(response_text)
-            if score is not None:
-                self.previous_scores.append(score) 
-                return score
-                
+            return image.data_url(self.upload_max_side, self.upload_jpeg_quality)
+        except Exception as e:
+            logging.error(f"Error: {e}")
+            return None
+
+    def _extract_scores(self, response: str, count: int) -> Optional[List[float]]:
+        logging.info(f"Raw response: {response}")
+        scores = parse_score_block(response, count)
+        if scores is None and count == 1:
+            match = FINAL_SCORE.search(response)
+            scores = [float(match.group(1))] if match else None
+        return scores
+
+    def _record_scores(self, response_text: str, count: int = 1) -> Optional[List[float]]:
+        scores = self._extract_scores(response_text, count)
+        if scores is None:
             logging.error("Failed to extract valid score from response")
             return None
+        session = self.session
+        return [session.record(score) for score in scores]
+
+    def _prefilter(self, image: ImageHandle) -> Tuple[Optional["QualityReport"], bool]:
+        """Run the local checks. Returns the report and whether the remote call can be skipped."""
+        if self.prefilter is None:
+            return None, False
+        from image_quality import PASS
+        report = self.prefilter.assess(image.data)
+        metrics.set_attrs(prefilter=report.verdict)
+        if report.verdict != PASS:
+            logging.info(f"Prefilter {report.verdict} for {image.path}: {report.reason} (score {report.score})")
+            return report, True
+        return report, False
+
+    def _remote_result(self, report: Optional["QualityReport"], score: Optional[float]) -> Tuple[Optional[float], str]:
+        metrics.set_attrs(score=score)
+        if score is None:
+            return None, "no valid score from pixtral"
+        if report is not None:
+            self.prefilter.record(report, score)
+        return score, "scored by pixtral"
+
+    def _prepare(self, image: Union[str, ImageHandle]) -> Tuple[Optional["QualityReport"], Optional[str],
+                                                                Optional[Tuple[Optional[float], str]]]:
+        """Load, prefilter and encode an image. Returns (report, data url, None) when it needs Pixtral,
+        or a (score, reason) result in the last slot when it doesn't."""
+        image = self._load_image(image)
+        if image is None:
+            logging.error("Image encoding failed")
+            return None, None, (None, "image could not be read")
+        report, skip = self._prefilter(image)
+        if skip:
+            return report, None, (report.score, report.reason)
 
+        image_url = self._encode_image(image)
+        if image_url is None:
+            logging.error("Image encoding failed")
+            return report, None, (None, "image encoding failed")
+        return report, image_url, None
+
+    def _complete(self, images: List[Tuple[str, str]]) -> str:
+        chat_response = self.endpoint.call(lambda: self.client.chat.complete(
+            model="pixtral-12b-2409",
+            messages=self._build_messages(images),
+            temperature=0.7
+        ))
+        return chat_response.choices[0].message.content
+
+    async def _complete_async(self, images: List[Tuple[str, str]]) -> str:
+        chat_response = await self.endpoint.call_async(lambda: self.client.chat.complete_async(
+            model="pixtral-12b-2409",
+            messages=self._build_messages(images),
+            temperature=0.7
+        ))
+        return chat_response.choices[0].message.content
+
+    def evaluate_image(self, image: Union[str, ImageHandle], original_prompt: str) -> Tuple[Optional[float], str]:
+        """Like analyze_image, but also returns the reason behind the score,
+        e.g. a local prefilter rejection that skipped the Pixtral call."""
+        with metrics.span("analyze_image"):
+            return self._evaluate_image(image, original_prompt)
+
+    def _evaluate_image(self, image: Union[str, ImageHandle], original_prompt: str) -> Tuple[Optional[float], str]:
+        report, image_url, result = self._prepare(image)
+        if result is not None:
+            return result
+        metrics.set_attrs(request_bytes=len(image_url))
+        return self._score_one(report, image_url, original_prompt)
+
+    def _score_one(self, report: Optional["QualityReport"], image_url: str,
+                   original_prompt: str) -> Tuple[Optional[float], str]:
+        try:
+            scores = self._record_scores(self._complete([(image_url, original_prompt)]))
+            return self._remote_result(report, scores[0] if scores else None)
+
+        except Exception as e:
+            logging.error(f"API call failed: {e}")
+            metrics.mark_error(e)
+            return None, f"pixtral call failed: {e}"
+
+    async def evaluate_image_async(self, image: Union[str, ImageHandle], original_prompt: str) -> Tuple[Optional[float], str]:
+        """Async version of evaluate_image."""
+        with metrics.span("analyze_image"):
+            return await self._evaluate_image_async(image, original_prompt)
+
+    async def _evaluate_image_async(self, image: Union[str, ImageHandle],
+                                    original_prompt: str) -> Tuple[Optional[float], str]:
+        report, image_url, result = await asyncio.to_thread(self._prepare, image)
+        if result is not None:
+            return result
+        metrics.set_attrs(request_bytes=len(image_url))
+        return await self._score_one_async(report, image_url, original_prompt)
+
+    async def _score_one_async(self, report: Optional["QualityReport"], image_url: str,
+                               original_prompt: str) -> Tuple[Optional[float], str]:
+        try:
+            scores = self._record_scores(await self._complete_async([(image_url, original_prompt)]))
+            return self._remote_result(report, scores[0] if scores else None)
+
+        except Exception as e:
+            logging.error(f"API call failed: {e}")
+            metrics.mark_error(e)
+            return None, f"pixtral call failed: {e}"
+
+    def evaluate_images(self, images: List[Union[str, ImageHandle]],
+                        original_prompts: List[str]) -> List[Tuple[Optional[float], str]]:
+        """Score several images of one title, packing up to batch_size of them into each Pixtral request
+        so the system prompt and score context are sent once per request instead of once per image.
+        A request whose score block can't be parsed is retried one image per call.
+        Returns a (score, reason) pair per image, in order."""
+        with metrics.span("analyze_images", images=len(images)):
+            results, pending = self._prepare_batch(images, original_prompts)
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+                for (index, report, image_url, original_prompt), result in zip(batch, self._score_batch(batch)):
+                    results[index] = result
+            return results
+
+    def _prepare_batch(self, images: List[Union[str, ImageHandle]], original_prompts: List[str]):
+        results: List[Optional[Tuple[Optional[float], str]]] = [None] * len(images)
+        pending = []
+        for index, (image, original_prompt) in enumerate(zip(images, original_prompts)):
+            report, image_url, result = self._prepare(image)
+            if result is not None:
+                results[index] = result
+            else:
+                pending.append((index, report, image_url, original_prompt))
+        metrics.set_attrs(requests=-(-len(pending) // self.batch_size),
+                          request_bytes=sum(len(item[2]) for item in pending))
+        return results, pending
+
+    def _score_batch(self, batch: list) -> List[Tuple[Optional[float], str]]:
+        if len(batch) == 1:
+            _, report, image_url, original_prompt = batch[0]
+            return [self._score_one(report, image_url, original_prompt)]
+        try:
+            response = self._complete([(image_url, original_prompt) for _, _, image_url, original_prompt in batch])
         except Exception as e:
             logging.error(f"API call failed: {e}")
-            return None
\ No newline at end of file
+            metrics.mark_error(e)
+            return [(None, f"pixtral call failed: {e}")] * len(batch)
+        scores = self._record_scores(response, len(batch))
+        if scores is None:
+            logging.error(f"No score block for a batch of {len(batch)} images, scoring them one at a time")
+            metrics.add_event("batch_fallback", images=len(batch))
+            return [self._score_one(report, image_url, original_prompt)
+                    for _, report, image_url, original_prompt in batch]
+        return [self._remote_result(report, score) for (_, report, _, _), score in zip(batch, scores)]
+
+    async def evaluate_images_async(self, images: List[Union[str, ImageHandle]],
+                                    original_prompts: List[str]) -> List[Tuple[Optional[float], str]]:
+        """Async version of evaluate_images."""
+        with metrics.span("analyze_images", images=len(images)):
+            results, pending = await asyncio.to_thread(self._prepare_batch, images, original_prompts)
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+                for (index, report, image_url, original_prompt), result in zip(batch, await self._score_batch_async(batch)):
+                    results[index] = result
+            return results
+
+    async def _score_batch_async(self, batch: list) -> List[Tuple[Optional[float], str]]:
+        if len(batch) == 1:
+            _, report, image_url, original_prompt = batch[0]
+            return [await self._score_one_async(report, image_url, original_prompt)]
+        try:
+            response = await self._complete_async([(image_url, original_prompt)
+                                                   for _, _, image_url, original_prompt in batch])
+        except Exception as e:
+            logging.error(f"API call failed: {e}")
+            metrics.mark_error(e)
+            return [(None, f"pixtral call failed: {e}")] * len(batch)
+        scores = self._record_scores(response, len(batch))
+        if scores is None:
+            logging.error(f"No score block for a batch of {len(batch)} images, scoring them one at a time")
+            metrics.add_event("batch_fallback", images=len(batch))
+            return [await self._score_one_async(report, image_url, original_prompt)
+                    for _, report, image_url, original_prompt in batch]
+        return [self._remote_result(report, score) for (_, report, _, _), score in zip(batch, scores)]
+
+    def analyze_image(self, image_path: Union[str, ImageHandle], original_prompt: str) -> Optional[float]:
+        """Analyzes the image using the Pixtral model with context.
+        Accepts a file path or an ImageHandle, whose in-memory bytes are used without re-reading the file.
+        Returns a float score between 0-10 or None if analysis fails."""
+        return self.evaluate_image(image_path, original_prompt)[0]
+
+    async def analyze_image_async(self, image_path: Union[str, ImageHandle], original_prompt: str) -> Optional[float]:
+        """Async version of analyze_image."""
+        return (await self.evaluate_image_async(image_path, original_prompt))[0]
+
+
+class ScoreBatcher:
+    """Collects evaluate_image calls that arrive close together from concurrent scene workers and sends
+    them to Pixtral as one evaluate_images request, keeping titles in separate groups. The first caller
+    in a group waits up to max_wait for others to join, then scores the group on everyone's behalf."""
+    def __init__(self, analyzer: ImageAnalyzer, max_wait: float = 0.05):
+        self.analyzer = analyzer
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._groups: Dict[str, List[dict]] = {}
+
+    def evaluate_image(self, image: Union[str, ImageHandle], original_prompt: str,
+                       group: str = "") -> Tuple[Optional[float], str]:
+        with metrics.span("analyze_image", batched=True):
+            request = {"image": image, "prompt": original_prompt, "result": None, "done": False}
+            deadline = time.monotonic() + self.max_wait
+            with self._cond:
+                self._groups.setdefault(group, []).append(request)
+                self._cond.notify_all()
+                while not request["done"]:
+                    queue = self._groups.get(group, [])
+                    remaining = deadline - time.monotonic()
+                    if queue and queue[0] is request and (len(queue) >= self.analyzer.batch_size or remaining <= 0):
+                        batch = queue[:self.analyzer.batch_size]
+                        del queue[:len(batch)]
+                        if not queue:
+                            del self._groups[group]
+                        # Whoever is now at the head leads the next batch while this one is in flight
+                        self._cond.notify_all()
+                        break
+                    head = queue and queue[0] is request
+                    self._cond.wait(remaining if head else max(self.max_wait, 0.01))
+                else:
+                    metrics.set_attrs(score=request["result"][0])
+                    return request["result"]
+
+            try:
+                results = self.analyzer.evaluate_images([r["image"] for r in batch], [r["prompt"] for r in batch])
+            except Exception as e:
+                logging.error(f"Batch scoring failed: {e}")
+                results = [(None, f"pixtral call failed: {e}")] * len(batch)
+            with self._cond:
+                for waiting, result in zip(batch, results):
+                    waiting["result"] = result
+                    waiting["done"] = True
+                self._cond.notify_all()
+            metrics.set_attrs(score=request["result"][0], batch=len(batch))
+            return request["result"]
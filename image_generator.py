@@ -1,56 +1,144 @@
 import os
-import requests
 import logging
-from typing import Optional
-import time
-import base64
+from typing import Dict, Optional
 import random
+import hashlib
+import threading
+from http_client import AsyncHTTPClient
+from image_cache import ImageCache
+from image_handle import ImageHandle
+from generation_backends import DEFAULT_TIERS, CloudflareBackend, GenerationBackend, GenerationTier
+from rate_limiter import RemoteEndpoint
+import metrics
+
+
 class ImageGenerator:
-    def __init__(self, cloudflare_account_id: str, cloudflare_api_token: str, output_directory: str = "generated_images"):
-        self.api_url = f"https://api.cloudflare.com/client/v4/accounts/{cloudflare_account_id}/ai/run/@cf/black-forest-labs/flux-1-schnell"
-        self.api_token = cloudflare_api_token
+    def __init__(self, cloudflare_account_id: str, cloudflare_api_token: str, output_directory: str = "generated_images",
+                 http_client: Optional[AsyncHTTPClient] = None, cache: Optional[ImageCache] = None,
+                 seed: Optional[int] = None, endpoint: Optional[RemoteEndpoint] = None, api_base: Optional[str] = None,
+                 backend: Optional[GenerationBackend] = None, tiers: Optional[Dict[str, GenerationTier]] = None):
+        """backend defaults to Workers AI with the given credentials; tiers maps tier names
+        ("draft", "final") to the model and render parameters each request is sent with."""
+        self.backend = backend or CloudflareBackend(cloudflare_account_id, cloudflare_api_token, api_base=api_base,
+                                                    http_client=http_client, endpoint=endpoint)
+        self.tiers = dict(DEFAULT_TIERS, **(tiers or {}))
         self.output_directory = os.path.abspath(output_directory)
+        self.cache = cache
+        # A pinned seed makes identical prompts produce identical requests, so the cache can hit
+        self.seed = seed
         os.makedirs(self.output_directory, exist_ok=True)
 
-    def generate_image(self, prompt: str, image_number: int) -> Optional[str]:
+    def _build_payload(self, prompt: str, seed: Optional[int] = None, tier: str = "final") -> dict:
+        tier = self.tiers[tier]
+        simplified_prompt = f"Professional product photography: {prompt}"
+        simplified_prompt = simplified_prompt[:self.backend.max_prompt_length]
+
+        if seed is None:
+            seed = self.seed if self.seed is not None else random.randint(1, 1000000)
+
+        return {
+            "prompt": simplified_prompt,
+            "num_steps": tier.num_steps,
+            "width": tier.width,
+            "height": tier.height,
+            "guidance_scale": tier.guidance_scale,
+            "seed": seed
+        }
+
+    def _cache_key(self, payload: dict, tier: str) -> str:
+        return ImageCache.make_key(dict(payload, model=f"{self.backend.name}:{self.tiers[tier].model}"))
+
+    def _save_image(self, image_data: bytes, image_number: int, payload: dict,
+                    output_directory: Optional[str] = None) -> ImageHandle:
+        """Save under an immutable content-addressed name, scene_{n}_{hash}.png, so a retry never
+        overwrites an image that was already scored and identical bytes are written once."""
+        output_directory = output_directory or self.output_directory
+        os.makedirs(output_directory, exist_ok=True)
+        digest = hashlib.sha256(image_data).hexdigest()
+        image_path = os.path.join(output_directory, f"scene_{image_number}_{digest[:16]}.png")
+
+        if not os.path.exists(image_path):
+            temp_path = f"{image_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(image_data)
+            os.replace(temp_path, image_path)
+
+        print(f"✓ Image {image_number} generated successfully: {image_path}")
+        return ImageHandle(image_path, image_data, prompt=payload["prompt"], seed=payload["seed"], sha256=digest)
+
+    def _from_cache(self, payload: dict, tier: str, image_number: int,
+                    output_directory: Optional[str]) -> Optional[ImageHandle]:
+        if self.cache is None:
+            return None
+        image_data = self.cache.get(self._cache_key(payload, tier))
+        metrics.set_attrs(cache="hit" if image_data is not None else "miss")
+        if image_data is None:
+            return None
+        logging.info(f"Image cache hit for scene {image_number}")
+        return self._save_image(image_data, image_number, payload, output_directory)
+
+    def _store_result(self, payload: dict, tier: str, image_data: Optional[bytes], image_number: int,
+                      output_directory: Optional[str]) -> Optional[ImageHandle]:
+        if image_data is None:
+            return None
+        if self.cache is not None:
+            self.cache.put(self._cache_key(payload, tier), image_data)
+        return self._save_image(image_data, image_number, payload, output_directory)
+
+    def generate_image_handle(self, prompt: str, image_number: int, output_directory: Optional[str] = None,
+                              seed: Optional[int] = None, tier: str = "final") -> Optional[ImageHandle]:
+        """Generate an image and return it as an in-memory handle that also points at the saved file.
+        output_directory overrides the default folder, so titles run in parallel don't share files.
+        tier picks the model and render parameters, e.g. a cheap "draft" for screening."""
+        with metrics.span("generate_image", scene=image_number, tier=tier, backend=self.backend.name):
+            return self._generate_image_handle(prompt, image_number, output_directory, seed, tier)
+
+    def _generate_image_handle(self, prompt: str, image_number: int, output_directory: Optional[str],
+                               seed: Optional[int], tier: str) -> Optional[ImageHandle]:
+        try:
+            payload = self._build_payload(prompt, seed, tier)
+            metrics.set_attrs(seed=payload["seed"])
+            cached = self._from_cache(payload, tier, image_number, output_directory)
+            if cached:
+                return cached
+            image_data = self.backend.generate(payload, self.tiers[tier].model)
+            return self._store_result(payload, tier, image_data, image_number, output_directory)
+
+        except Exception as e:
+            logging.error(f"Error generating image: {e}")
+            metrics.mark_error(e)
+            return None
+
+    def generate_image(self, prompt: str, image_number: int, output_directory: Optional[str] = None,
+                       seed: Optional[int] = None, tier: str = "final") -> Optional[str]:
         """Generate an image with simplified prompt."""
+        image = self.generate_image_handle(prompt, image_number, output_directory, seed, tier)
+        return image.path if image else None
+
+    async def generate_image_handle_async(self, prompt: str, image_number: int, output_directory: Optional[str] = None,
+                                          seed: Optional[int] = None, tier: str = "final") -> Optional[ImageHandle]:
+        """Async version of generate_image_handle using the shared aiohttp session."""
+        with metrics.span("generate_image", scene=image_number, tier=tier, backend=self.backend.name):
+            return await self._generate_image_handle_async(prompt, image_number, output_directory, seed, tier)
+
+    async def _generate_image_handle_async(self, prompt: str, image_number: int, output_directory: Optional[str],
+                                           seed: Optional[int], tier: str) -> Optional[ImageHandle]:
         try:
-            
-            simplified_prompt = f"Professional product photography: {prompt}"
-            simplified_prompt = simplified_prompt[:200]  
-            
-            payload = {
-                "prompt": simplified_prompt,
-                "num_steps": 15,
-                "width": 1280,
-                "height": 720,
-                "guidance_scale": 7.5,  
-                "seed": random.randint(1, 1000000)  
-            }
-            
-            response = requests.post(
-                self.api_url,
-                headers={"Authorization": f"Bearer {self.api_token}"},
-                verify=False,
-                json=payload,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if 'result' in result and 'image' in result['result']:
-                    image_data = base64.b64decode(result['result']['image'])
-                    image_path = os.path.join(self.output_directory, f"scene_{image_number}.png")
-                    
-                    with open(image_path, "wb") as f:
-                        f.write(image_data)
-                    
-                    print(f"✓ Image {image_number} generated successfully: {image_path}")
-                    return image_path
-            else:
-                logging.error(f"Image generation failed: {response.status_code} - {response.text}")
-                return None
-            
+            payload = self._build_payload(prompt, seed, tier)
+            metrics.set_attrs(seed=payload["seed"])
+            cached = self._from_cache(payload, tier, image_number, output_directory)
+            if cached:
+                return cached
+            image_data = await self.backend.generate_async(payload, self.tiers[tier].model)
+            return self._store_result(payload, tier, image_data, image_number, output_directory)
+
         except Exception as e:
             logging.error(f"Error generating image: {e}")
-            return None
\ No newline at end of file
+            metrics.mark_error(e)
+            return None
+
+    async def generate_image_async(self, prompt: str, image_number: int, output_directory: Optional[str] = None,
+                                   seed: Optional[int] = None, tier: str = "final") -> Optional[str]:
+        """Async version of generate_image."""
+        image = await self.generate_image_handle_async(prompt, image_number, output_directory, seed, tier)
+        return image.path if image else None
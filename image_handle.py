@@ -0,0 +1,58 @@
+import io
+import base64
+import hashlib
+from typing import Optional
+from PIL import Image
+
+
+class ImageHandle:
+    """Decoded image bytes kept in memory alongside the file they were saved to,
+    so the analyzer can reuse them instead of re-reading the file."""
+    def __init__(self, path: str, data: bytes, prompt: Optional[str] = None, seed: Optional[int] = None,
+                 sha256: Optional[str] = None):
+        self.path = path
+        self.data = data
+        self.prompt = prompt
+        self.seed = seed
+        self._sha256 = sha256
+
+    @classmethod
+    def from_path(cls, path: str) -> "ImageHandle":
+        with open(path, "rb") as f:
+            return cls(path, f.read())
+
+    @property
+    def sha256(self) -> str:
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.data).hexdigest()
+        return self._sha256
+
+    @property
+    def mime_type(self) -> str:
+        if self.data[:3] == b"\xff\xd8\xff":
+            return "image/jpeg"
+        if self.data[:4] == b"RIFF" and self.data[8:12] == b"WEBP":
+            return "image/webp"
+        return "image/png"
+
+    def upload_bytes(self, max_side: Optional[int] = None, jpeg_quality: Optional[int] = None):
+        """Bytes and mime type to upload, optionally downscaled and/or re-encoded as JPEG.
+        Returns the original bytes untouched when no option applies."""
+        if max_side is None and jpeg_quality is None:
+            return self.data, self.mime_type
+
+        with Image.open(io.BytesIO(self.data)) as img:
+            if max_side is not None and max(img.size) > max_side:
+                img.thumbnail((max_side, max_side), Image.LANCZOS)
+            elif jpeg_quality is None:
+                return self.data, self.mime_type
+            out = io.BytesIO()
+            if jpeg_quality is not None:
+                img.convert("RGB").save(out, format="JPEG", quality=jpeg_quality, optimize=True)
+                return out.getvalue(), "image/jpeg"
+            img.save(out, format="PNG", optimize=True)
+            return out.getvalue(), "image/png"
+
+    def data_url(self, max_side: Optional[int] = None, jpeg_quality: Optional[int] = None) -> str:
+        data, mime_type = self.upload_bytes(max_side, jpeg_quality)
+        return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
@@ -0,0 +1,112 @@
+import io
+import os
+import logging
+import threading
+from collections import deque
+from typing import Optional, Union
+import numpy as np
+from PIL import Image
+
+REJECT = "reject"
+PASS = "pass"
+FAST_TRACK = "fast_track"
+
+
+class QualityReport:
+    """Outcome of the local checks: a verdict, the reason behind it and the raw metrics."""
+    def __init__(self, verdict: str, reason: str, metrics: Optional[dict] = None, score: Optional[float] = None,
+                 fingerprint: Optional[np.ndarray] = None):
+        self.verdict = verdict
+        self.reason = reason
+        self.metrics = metrics or {}
+        self.score = score
+        self.fingerprint = fingerprint
+
+    def __repr__(self):
+        return f"QualityReport({self.verdict!r}, {self.reason!r}, score={self.score})"
+
+
+class ImagePrefilter:
+    """Cheap local scoring run before the remote Pixtral call.
+    Rejects blank, near-uniform, tiny, blurry or badly exposed images and fast-tracks near-duplicates
+    of an image that already has a remote score, reusing that score."""
+    def __init__(self, min_bytes: int = 10 * 1024, min_std: float = 6.0, min_entropy: float = 3.0,
+                 min_sharpness: float = 10.0, max_clipped: float = 0.6, duplicate_threshold: float = 2.0,
+                 history_size: int = 256, reject_score: float = 0.0):
+        self.min_bytes = min_bytes
+        self.min_std = min_std
+        self.min_entropy = min_entropy
+        self.min_sharpness = min_sharpness
+        self.max_clipped = max_clipped
+        self.duplicate_threshold = duplicate_threshold
+        self.reject_score = reject_score
+        self._history = deque(maxlen=history_size)  # (fingerprint, remote score)
+        self._lock = threading.Lock()
+
+    def _load(self, image: Union[str, bytes]):
+        if isinstance(image, bytes):
+            return len(image), Image.open(io.BytesIO(image))
+        return os.path.getsize(image), Image.open(image)
+
+    def _fingerprint(self, gray: np.ndarray) -> np.ndarray:
+        thumb = Image.fromarray(gray.astype(np.uint8)).resize((16, 16), Image.BILINEAR)
+        return np.asarray(thumb, dtype=np.float32)
+
+    def _find_duplicate(self, fingerprint: np.ndarray) -> Optional[float]:
+        with self._lock:
+            for previous, score in reversed(self._history):
+                if np.abs(previous - fingerprint).mean() < self.duplicate_threshold:
+                    return score
+        return None
+
+    def assess(self, image: Union[str, bytes]) -> QualityReport:
+        """Score an image path or encoded bytes without any network call."""
+        try:
+            size, img = self._load(image)
+            with img:
+                img.thumbnail((256, 256))
+                gray = np.asarray(img.convert("L"), dtype=np.float32)
+        except Exception as e:
+            logging.error(f"Prefilter could not read image: {e}")
+            return QualityReport(REJECT, f"unreadable image: {e}", score=self.reject_score)
+
+        histogram = np.bincount(gray.astype(np.uint8).ravel(), minlength=256) / gray.size
+        nonzero = histogram[histogram > 0]
+        laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+                     - 4 * gray[1:-1, 1:-1])
+        metrics = {
+            "bytes": size,
+            "mean": round(float(gray.mean()), 2),
+            "std": round(float(gray.std()), 2),
+            "entropy": round(float(-(nonzero * np.log2(nonzero)).sum()), 3),
+            "sharpness": round(float(laplacian.var()), 2),
+            "clipped": round(float(histogram[:6].sum() + histogram[250:].sum()), 3)
+        }
+
+        if metrics["std"] < self.min_std:
+            reason = "black frame (likely safety filtered)" if metrics["mean"] < 10 else "near-uniform image"
+            return QualityReport(REJECT, reason, metrics, self.reject_score)
+        if size < self.min_bytes:
+            return QualityReport(REJECT, f"tiny file ({size} bytes)", metrics, self.reject_score)
+        if metrics["entropy"] < self.min_entropy:
+            return QualityReport(REJECT, f"low entropy ({metrics['entropy']})", metrics, self.reject_score)
+        if metrics["sharpness"] < self.min_sharpness:
+            return QualityReport(REJECT, f"blurry (laplacian variance {metrics['sharpness']})", metrics,
+                                 self.reject_score)
+        if metrics["clipped"] > self.max_clipped:
+            return QualityReport(REJECT, f"badly exposed ({metrics['clipped']:.0%} clipped)", metrics,
+                                 self.reject_score)
+
+        fingerprint = self._fingerprint(gray)
+        duplicate_score = self._find_duplicate(fingerprint)
+        if duplicate_score is not None:
+            return QualityReport(FAST_TRACK, "near-duplicate of an already scored image", metrics, duplicate_score,
+                                 fingerprint)
+        return QualityReport(PASS, "passed local checks", metrics, fingerprint=fingerprint)
+
+    def record(self, report: QualityReport, score: float):
+        """Remember the remote score for an image that passed, so near-duplicates can reuse it."""
+        if report.fingerprint is None:
+            return
+        with self._lock:
+            self._history.append((report.fingerprint, score))
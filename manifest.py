@@ -0,0 +1,74 @@
+import os
+import json
+import time
+import uuid
+import threading
+from typing import List, Optional
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+class RunManifest:
+    """Append-only JSONL record of every generation attempt in a run: prompt, seed, score, timings
+    and the content hash of the saved image. Entries with accepted=True are the scene winners."""
+    def __init__(self, output_directory: str, title: str, run_id: Optional[str] = None):
+        self.path = os.path.join(output_directory, MANIFEST_NAME)
+        self.title = title
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()
+        os.makedirs(output_directory, exist_ok=True)
+
+    def record(self, scene: int, prompt: str, image=None, score: Optional[float] = None, reason: str = "",
+               accepted: bool = False, generation_seconds: Optional[float] = None,
+               analysis_seconds: Optional[float] = None) -> dict:
+        """Append one attempt; image is the ImageHandle it produced, or None if generation failed."""
+        entry = {
+            "run_id": self.run_id,
+            "title": self.title,
+            "scene": scene,
+            "prompt": prompt,
+            "seed": image.seed if image is not None else None,
+            "image_path": image.path if image is not None else None,
+            "sha256": image.sha256 if image is not None else None,
+            "bytes": len(image.data) if image is not None else None,
+            "score": score,
+            "reason": reason,
+            "accepted": accepted,
+            "generation_seconds": round(generation_seconds, 3) if generation_seconds is not None else None,
+            "analysis_seconds": round(analysis_seconds, 3) if analysis_seconds is not None else None,
+            "time": time.time()
+        }
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+        return entry
+
+    def winners(self) -> List[dict]:
+        """Accepted entries of this run, in scene order."""
+        return read_winners(self.path, self.run_id)
+
+
+def read_entries(path: str, run_id: Optional[str] = None) -> List[dict]:
+    """All manifest entries, optionally only those of one run. A torn last line from a crash is skipped."""
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if run_id is None or entry.get("run_id") == run_id:
+                entries.append(entry)
+    return entries
+
+
+def read_winners(path: str, run_id: Optional[str] = None) -> List[dict]:
+    """Accepted entries in scene order. A scene redone after a resumed run keeps only its latest winner."""
+    winners = {}
+    for entry in read_entries(path, run_id):
+        if entry.get("accepted"):
+            winners[(entry["run_id"], entry["scene"])] = entry
+    return sorted(winners.values(), key=lambda entry: entry["scene"])
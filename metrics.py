@@ -0,0 +1,205 @@
+import json
+import time
+import threading
+import contextvars
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Span:
+    """Timing of one stage call, with attributes such as HTTP status, payload sizes and attempts."""
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+        self.events: List[dict] = []
+        self.start = time.time()
+        self._perf_start = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def event(self, name: str, **attrs):
+        self.events.append({"name": name, "offset": round(time.perf_counter() - self._perf_start, 4), **attrs})
+
+    @property
+    def status(self) -> str:
+        return str(self.attrs.get("status", "ok"))
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "start": self.start,
+            "duration": round(self.duration, 4) if self.duration is not None else None,
+            "attrs": self.attrs,
+            "events": self.events
+        }
+
+
+class Trace:
+    """All spans recorded while processing one title, across worker threads."""
+    def __init__(self, title: str):
+        self.title = title
+        self.start = time.time()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = [span.to_dict() for span in self.spans]
+        return {"title": self.title, "start": self.start, "spans": spans}
+
+    def write(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+
+
+class MetricsRegistry:
+    """Process-wide per-stage latency samples and counters, exportable as Prometheus text."""
+    def __init__(self, max_samples: int = 10000):
+        self._durations = defaultdict(lambda: deque(maxlen=max_samples))
+        self._totals = defaultdict(lambda: [0, 0.0])  # stage -> [count, sum] over all samples
+        self._requests = defaultdict(int)  # (stage, status) -> count
+        self._retries = defaultdict(int)  # (stage, reason) -> count
+        self._bytes = defaultdict(int)  # (stage, direction) -> bytes
+        self._lock = threading.Lock()
+
+    def observe(self, span: Span):
+        with self._lock:
+            self._durations[span.name].append(span.duration)
+            totals = self._totals[span.name]
+            totals[0] += 1
+            totals[1] += span.duration
+            self._requests[(span.name, span.status)] += 1
+            for direction in ("request_bytes", "response_bytes"):
+                if span.attrs.get(direction):
+                    self._bytes[(span.name, direction)] += span.attrs[direction]
+            for event in span.events:
+                if event["name"] == "retry":
+                    self._retries[(span.name, str(event.get("reason", "unknown")))] += 1
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+            self._totals.clear()
+            self._requests.clear()
+            self._retries.clear()
+            self._bytes.clear()
+
+    def quantiles(self) -> Dict[str, dict]:
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self._durations.items() if values}
+        summary = {}
+        for stage, values in samples.items():
+            summary[stage] = {"count": len(values)}
+            for q in QUANTILES:
+                summary[stage][f"p{int(q * 100)}"] = values[min(len(values) - 1, int(q * len(values)))]
+        return summary
+
+    def prometheus_text(self) -> str:
+        lines = ["# HELP scene_stage_duration_seconds Latency of each pipeline stage.",
+                 "# TYPE scene_stage_duration_seconds summary"]
+        for stage, stats in sorted(self.quantiles().items()):
+            for q in QUANTILES:
+                lines.append(f'scene_stage_duration_seconds{{stage="{stage}",quantile="{q}"}} '
+                             f'{stats[f"p{int(q * 100)}"]:.6f}')
+        with self._lock:
+            totals = dict(self._totals)
+            requests = dict(self._requests)
+            retries = dict(self._retries)
+            payload = dict(self._bytes)
+        for stage, (count, total) in sorted(totals.items()):
+            lines.append(f'scene_stage_duration_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'scene_stage_duration_seconds_count{{stage="{stage}"}} {count}')
+        lines += ["# HELP scene_stage_calls_total Stage calls by outcome status.",
+                  "# TYPE scene_stage_calls_total counter"]
+        for (stage, status), count in sorted(requests.items()):
+            lines.append(f'scene_stage_calls_total{{stage="{stage}",status="{status}"}} {count}')
+        lines += ["# HELP scene_stage_retries_total Retries by stage and reason.",
+                  "# TYPE scene_stage_retries_total counter"]
+        for (stage, reason), count in sorted(retries.items()):
+            lines.append(f'scene_stage_retries_total{{stage="{stage}",reason="{reason}"}} {count}')
+        lines += ["# HELP scene_stage_payload_bytes_total Bytes sent and received per stage.",
+                  "# TYPE scene_stage_payload_bytes_total counter"]
+        for (stage, direction), total in sorted(payload.items()):
+            lines.append(f'scene_stage_payload_bytes_total{{stage="{stage}",direction="{direction[:-6]}"}} {total}')
+        return "\n".join(lines) + "\n"
+
+    def summary_table(self) -> str:
+        rows = [f"{'stage':<22}{'count':>8}{'p50 (s)':>10}{'p95 (s)':>10}{'p99 (s)':>10}"]
+        for stage, stats in sorted(self.quantiles().items()):
+            rows.append(f"{stage:<22}{stats['count']:>8}{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['p99']:>10.3f}")
+        return "\n".join(rows)
+
+
+REGISTRY = MetricsRegistry()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a stage call; the span is recorded in the registry and in the current title's trace."""
+    current = Span(name, attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attrs.setdefault("status", "error")
+        current.attrs.setdefault("error", str(e))
+        raise
+    finally:
+        current.duration = time.perf_counter() - current._perf_start
+        _current_span.reset(token)
+        REGISTRY.observe(current)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(current)
+
+
+def set_attrs(**attrs):
+    """Attach attributes to the innermost active span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attrs)
+
+
+def mark_error(error: Exception):
+    """Flag the innermost span as failed when the caller handles the exception itself."""
+    current = _current_span.get()
+    if current is not None:
+        current.attrs["error"] = str(error)
+        if current.attrs.get("status") in (None, "ok", 200):
+            current.attrs["status"] = "error"
+
+
+def add_event(name: str, **attrs):
+    """Record an event such as a retry on the innermost active span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.event(name, **attrs)
+
+
+@contextmanager
+def trace(title: str):
+    """Collect every span recorded in this context, including worker threads started via in_context."""
+    current = Trace(title)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+
+
+def in_context(fn):
+    """Wrap fn so it runs in a copy of the caller's context, carrying the current trace into a worker thread."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
@@ -0,0 +1,109 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+
+
+class PromptCache:
+    """Persistent SQLite memo of LLM responses keyed by model URL, system prompt and user message.
+    Entries expire after ttl_seconds and the least recently used are dropped beyond max_entries."""
+    def __init__(self, path: str = "prompt_cache.sqlite3", ttl_seconds: Optional[float] = 7 * 24 * 3600,
+                 max_entries: int = 10000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.upstream_calls = 0
+        self.upstream_seconds = 0.0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS prompt_cache ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " latency REAL NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS prompt_cache_accessed ON prompt_cache (accessed)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_url: str, system_prompt: str, user_message: str) -> str:
+        material = json.dumps([model_url, system_prompt, user_message])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, latency, created FROM prompt_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            response, latency, created = row
+            if self.ttl_seconds is not None and now - created > self.ttl_seconds:
+                self._conn.execute("DELETE FROM prompt_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE prompt_cache SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            self.saved_seconds += latency
+            return response
+
+    def put(self, key: str, response: str, latency: float):
+        """Store a fresh upstream response; latency is what the call cost, used for the savings stats."""
+        now = time.time()
+        with self._lock:
+            self.upstream_calls += 1
+            self.upstream_seconds += latency
+            self._conn.execute(
+                "INSERT OR REPLACE INTO prompt_cache (key, response, latency, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, response, latency, now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if self.ttl_seconds is not None:
+            cursor = self._conn.execute("DELETE FROM prompt_cache WHERE created < ?", (time.time() - self.ttl_seconds,))
+            self.expired += cursor.rowcount
+        count = self._conn.execute("SELECT COUNT(*) FROM prompt_cache").fetchone()[0]
+        if count > self.max_entries:
+            cursor = self._conn.execute(
+                "DELETE FROM prompt_cache WHERE key IN "
+                "(SELECT key FROM prompt_cache ORDER BY accessed ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+            self.evictions += cursor.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM prompt_cache").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "entries": entries,
+                "upstream_calls": self.upstream_calls,
+                "upstream_seconds": round(self.upstream_seconds, 3),
+                "saved_seconds": round(self.saved_seconds, 3)
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,61 +1,138 @@
-from typing import List
-import requests
+from typing import List, Optional
+import time
 import logging
+from http_client import CLOUDFLARE_API_BASE, AsyncHTTPClient, get_session
+from prompt_cache import PromptCache
+import metrics
+from rate_limiter import RemoteEndpoint, get_endpoint
 class PromptGenerator:
-    def __init__(self, cloudflare_account_id: str, cloudflare_api_token: str):
-        self.llama_api_url = f"https://api.cloudflare.com/client/v4/accounts/{cloudflare_account_id}/ai/run/@cf/meta/llama-3-8b-instruct-awq"
+    def __init__(self, cloudflare_account_id: str, cloudflare_api_token: str, http_client: Optional[AsyncHTTPClient] = None,
+                 cache: Optional[PromptCache] = None, fresh: bool = False, endpoint: Optional[RemoteEndpoint] = None,
+                 api_base: Optional[str] = None):
+        api_base = (api_base or CLOUDFLARE_API_BASE).rstrip("/")
+        self.llama_api_url = f"{api_base}/accounts/{cloudflare_account_id}/ai/run/@cf/meta/llama-3-8b-instruct-awq"
         self.api_token = cloudflare_api_token
+        self.http_client = http_client or AsyncHTTPClient()
+        self.endpoint = endpoint or get_endpoint("llama")
+        self.cache = cache
+        # fresh skips cache reads (responses are still stored) when sampling diversity matters more than cost
+        self.fresh = fresh
 
     def sanitize_prompt(self, prompt: str) -> str:
         """Sanitize prompt to avoid NSFW detection."""
-        
+
         words_to_remove = ['dark', 'smoke', 'speed', 'chase', 'blazing', 'rebel', 'edgy']
         sanitized = prompt.lower()
         for word in words_to_remove:
             sanitized = sanitized.replace(word.lower(), '')
-        
-        
-        if len(sanitized) > 200:
-            sanitized = sanitized[:200]
-        
+
+        # Length is capped once, by the image backend, so the end of the scene isn't cut twice
         return f"Professional photograph of {sanitized}"
 
-    def generate_scenes(self, title: str) -> List[str]:
-        """Generate scenes with simplified prompts."""
+    def _llama_payload(self, system_prompt: str, user_message: str) -> dict:
+        return {
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_message}
+            ]
+        }
+
+    def _parse_llama_response(self, result: dict) -> Optional[str]:
+        if 'result' in result and 'response' in result['result']:
+            return result['result']['response']
+        return None
+
+    def _cached(self, system_prompt: str, user_message: str, fresh: bool):
+        """Return (cache key, cached response). The key is None when caching is disabled."""
+        if self.cache is None:
+            return None, None
+        key = PromptCache.make_key(self.llama_api_url, system_prompt, user_message)
+        if fresh or self.fresh:
+            metrics.set_attrs(cache="bypass")
+            return key, None
+        cached = self.cache.get(key)
+        metrics.set_attrs(cache="hit" if cached is not None else "miss")
+        return key, cached
+
+    def _remember(self, key: Optional[str], text: Optional[str], start: float):
+        if key is not None and text is not None:
+            self.cache.put(key, text, time.perf_counter() - start)
+
+    def _call_llama(self, system_prompt: str, user_message: str, timeout: Optional[float] = 30,
+                    fresh: bool = False) -> Optional[str]:
+        """Send one chat request to Llama over the shared pooled session, memoized when a cache is set."""
+        key, cached = self._cached(system_prompt, user_message, fresh)
+        if cached is not None:
+            return cached
+
+        start = time.perf_counter()
+        response = self.endpoint.call(lambda: get_session().post(
+            self.llama_api_url,
+            headers={"Authorization": f"Bearer {self.api_token}"},
+            json=self._llama_payload(system_prompt, user_message),
+            verify=False,
+            timeout=timeout
+        ))
+        metrics.set_attrs(status=response.status_code, response_bytes=len(response.content))
+        response.raise_for_status()
+        text = self._parse_llama_response(response.json())
+        self._remember(key, text, start)
+        return text
+
+    async def _call_llama_async(self, system_prompt: str, user_message: str, timeout: Optional[float] = 30,
+                                fresh: bool = False) -> Optional[str]:
+        key, cached = self._cached(system_prompt, user_message, fresh)
+        if cached is not None:
+            return cached
+
+        start = time.perf_counter()
+        response = await self.endpoint.call_async(lambda: self.http_client.post(
+            self.llama_api_url,
+            headers={"Authorization": f"Bearer {self.api_token}"},
+            payload=self._llama_payload(system_prompt, user_message),
+            timeout=timeout
+        ))
+        metrics.set_attrs(status=response.status_code, response_bytes=len(response.content))
+        if response.status_code != 200:
+            raise RuntimeError(f"Llama request failed: {response.status_code} - {response.text}")
+        text = self._parse_llama_response(response.json())
+        self._remember(key, text, start)
+        return text
+
+    def _scenes_request(self, title: str):
         system_prompt = f"""Generate 6 simple, clean photography prompts for '{title}'.
         Format: Scene X: [Brief description focusing on lighting and composition]
         Keep it professional and suitable for commercial photography.
         Each prompt should be under 50 words.
         Focus on natural lighting and clean compositions."""
-        
-        try:
-            response = requests.post(
-                self.llama_api_url,
-                headers={"Authorization": f"Bearer {self.api_token}"},
-                json={
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": f"Generate 6 clean, professional cinematic prompts for: {title}"}
-                    ]
-                },
-                verify=False,
-                timeout=30
-            )
-            
-            response.raise_for_status()
-            result = response.json()
-            
-            if 'result' in result and 'response' in result['result']:
-                scenes = [scene.strip() for scene in result['result']['response'].strip().splitlines() if scene.strip()]
-                
-                sanitized_scenes = [self.sanitize_prompt(scene) for scene in scenes]
-                return sanitized_scenes
-            
-            return self._get_default_scenes(title)
-            
-        except Exception as e:
-            logging.error(f"Scene generation error: {e}")
+        return system_prompt, f"Generate 6 clean, professional cinematic prompts for: {title}"
+
+    def _parse_scenes(self, text: Optional[str], title: str) -> List[str]:
+        if text is None:
             return self._get_default_scenes(title)
+        scenes = [scene.strip() for scene in text.strip().splitlines() if scene.strip()]
+        return [self.sanitize_prompt(scene) for scene in scenes]
+
+    def generate_scenes(self, title: str, fresh: bool = False) -> List[str]:
+        """Generate scenes with simplified prompts."""
+        with metrics.span("generate_scenes"):
+            try:
+                return self._parse_scenes(self._call_llama(*self._scenes_request(title), fresh=fresh), title)
+            except Exception as e:
+                logging.error(f"Scene generation error: {e}")
+                metrics.mark_error(e)
+                return self._get_default_scenes(title)
+
+    async def generate_scenes_async(self, title: str, fresh: bool = False) -> List[str]:
+        """Async version of generate_scenes."""
+        with metrics.span("generate_scenes"):
+            try:
+                return self._parse_scenes(await self._call_llama_async(*self._scenes_request(title), fresh=fresh),
+                                          title)
+            except Exception as e:
+                logging.error(f"Scene generation error: {e}")
+                metrics.mark_error(e)
+                return self._get_default_scenes(title)
 
 
     def _get_default_scenes(self, title: str) -> List[str]:
@@ -66,7 +143,7 @@ class PromptGenerator:
         """Validate each scene to ensure it's relevant to the title."""
         validated_scenes = []
         keywords = set(title.lower().split())
-        
+
         for scene in scenes:
             scene_lower = scene.lower()
             if any(keyword in scene_lower for keyword in keywords):
@@ -75,42 +152,45 @@ class PromptGenerator:
                 new_scene = self.regenerate_scene(title, len(validated_scenes) + 1)
                 if new_scene:
                     validated_scenes.append(new_scene)
-                    
+
         return validated_scenes[:6]
 
-    def regenerate_scene(self, title: str, scene_number: int) -> str:
-        """Regenerate a single scene with stronger relevance to the title."""
+    def _regenerate_request(self, title: str, scene_number: int):
         system_prompt = f"""Generate a single, highly detailed scene for a {title} commercial.
         Scene number: {scene_number}
-        
+
         MUST include these elements:
         1. Direct reference to {title}
         2. Specific camera angles and movements
         3. Detailed lighting setup
         4. Exact composition details
-        
+
         Format: Scene {scene_number}: [Technical description]"""
+        return system_prompt, f"Generate scene {scene_number} for {title}"
+
+    def _default_scene(self, title: str, scene_number: int) -> str:
+        return f"Scene {scene_number}: Default scene for {title} with dramatic lighting and composition"
+
+    def regenerate_scene(self, title: str, scene_number: int, fresh: bool = False) -> str:
+        """Regenerate a single scene with stronger relevance to the title.
+        Pass fresh=True to bypass the prompt cache when a previous alternative already failed."""
+        with metrics.span("regenerate_scene", scene=scene_number):
+            try:
+                text = self._call_llama(*self._regenerate_request(title, scene_number), timeout=None, fresh=fresh)
+                return text.strip() if text is not None else self._default_scene(title, scene_number)
+            except Exception as e:
+                logging.error(f"Scene regeneration error: {e}")
+                metrics.mark_error(e)
+                return self._default_scene(title, scene_number)
 
-        try:
-            response = requests.post(
-                self.llama_api_url,
-                headers={"Authorization": f"Bearer {self.api_token}"},
-                json={
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": f"Generate scene {scene_number} for {title}"}
-                    ]
-                },
-                verify=False
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if 'result' in result and 'response' in result['result']:
-                    return result['result']['response'].strip()
-                    
-            return f"Scene {scene_number}: Default scene for {title} with dramatic lighting and composition"
-            
-        except Exception as e:
-            logging.error(f"Scene regeneration error: {e}")
-            return f"Scene {scene_number}: Default scene for {title} with dramatic lighting and composition"
\ No newline at end of file
+    async def regenerate_scene_async(self, title: str, scene_number: int, fresh: bool = False) -> str:
+        """Async version of regenerate_scene."""
+        with metrics.span("regenerate_scene", scene=scene_number):
+            try:
+                text = await self._call_llama_async(*self._regenerate_request(title, scene_number), timeout=None,
+                                                    fresh=fresh)
+                return text.strip() if text is not None else self._default_scene(title, scene_number)
+            except Exception as e:
+                logging.error(f"Scene regeneration error: {e}")
+                metrics.mark_error(e)
+                return self._default_scene(title, scene_number)
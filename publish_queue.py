@@ -0,0 +1,206 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Iterable, List, Optional, Tuple
+import metrics
+
+PENDING = "pending"
+UPLOADING = "uploading"
+DONE = "done"
+FAILED = "failed"
+
+
+class PublishQueue:
+    """Persistent SQLite record of every image waiting for, or done with, a Pinterest upload.
+    Rows left in 'uploading' by a crashed process go back to 'pending' when the queue is reopened."""
+    def __init__(self, path: str = "publish_queue.sqlite3", max_attempts: int = 5, retry_delay: float = 60.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS publish_queue ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " image_path TEXT NOT NULL,"
+            " board_name TEXT NOT NULL,"
+            " title TEXT,"
+            " state TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT,"
+            " not_before REAL NOT NULL DEFAULT 0,"
+            " created REAL NOT NULL,"
+            " updated REAL NOT NULL,"
+            " UNIQUE (image_path, board_name))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS publish_queue_state ON publish_queue (state, not_before)")
+        recovered = self._conn.execute("UPDATE publish_queue SET state = ? WHERE state = ?",
+                                       (PENDING, UPLOADING)).rowcount
+        self._conn.commit()
+        if recovered:
+            logging.info(f"Publish queue: {recovered} interrupted uploads returned to pending")
+
+    def enqueue(self, image_paths: Iterable[str], board_name: str = "AI", title: Optional[str] = None) -> int:
+        """Add images to the queue; images already queued for the same board are left as they are."""
+        now = time.time()
+        rows = [(os.path.abspath(path), board_name, title, PENDING, now, now) for path in image_paths]
+        with self._lock:
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO publish_queue (image_path, board_name, title, state, created, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def claim(self) -> Optional[Tuple[int, str, str]]:
+        """Mark the oldest due pending upload as in progress and return (id, image_path, board_name)."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, image_path, board_name FROM publish_queue WHERE state = ? AND not_before <= ?"
+                " ORDER BY id LIMIT 1", (PENDING, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE publish_queue SET state = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                               (UPLOADING, now, row[0]))
+            self._conn.commit()
+            return row
+
+    def complete(self, item_id: int):
+        with self._lock:
+            self._conn.execute("UPDATE publish_queue SET state = ?, error = NULL, updated = ? WHERE id = ?",
+                               (DONE, time.time(), item_id))
+            self._conn.commit()
+
+    def fail(self, item_id: int, error: str):
+        """Retry later with a growing delay, or give up once max_attempts is reached."""
+        now = time.time()
+        with self._lock:
+            attempts = self._conn.execute("SELECT attempts FROM publish_queue WHERE id = ?", (item_id,)).fetchone()[0]
+            state = FAILED if attempts >= self.max_attempts else PENDING
+            self._conn.execute(
+                "UPDATE publish_queue SET state = ?, error = ?, not_before = ?, updated = ? WHERE id = ?",
+                (state, error, now + self.retry_delay * 2 ** (attempts - 1), now, item_id)
+            )
+            self._conn.commit()
+
+    def retry_failed(self) -> int:
+        """Give uploads that ran out of attempts another round."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE publish_queue SET state = ?, attempts = 0, not_before = 0, updated = ? WHERE state = ?",
+                (PENDING, time.time(), FAILED)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def next_due(self) -> Optional[float]:
+        """Seconds until the next pending upload is due, 0 if one is due now, None if nothing is pending."""
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(not_before) FROM publish_queue WHERE state = ?",
+                                     (PENDING,)).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def failures(self, limit: int = 20) -> List[Tuple[str, str]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT image_path, error FROM publish_queue WHERE state = ? ORDER BY updated DESC LIMIT ?",
+                (FAILED, limit)
+            ).fetchall()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT state, COUNT(*) FROM publish_queue GROUP BY state").fetchall())
+        return {state: counts.get(state, 0) for state in (PENDING, UPLOADING, DONE, FAILED)}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class PinterestPublisher:
+    """Background workers that drain a PublishQueue through a SocialMediaManager,
+    so title generation never waits on Pinterest. Pending uploads from earlier runs are picked up on start."""
+    def __init__(self, social_media, queue: PublishQueue, workers: int = 2, poll_interval: float = 1.0):
+        self.social_media = social_media
+        self.queue = queue
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self._wake = threading.Condition()
+        self._stopping = False
+        self._active = 0
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> "PinterestPublisher":
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"pinterest-publisher-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def enqueue(self, image_paths: List[str], board_name: str = "AI", title: Optional[str] = None) -> int:
+        added = self.queue.enqueue(image_paths, board_name, title)
+        with self._wake:
+            self._wake.notify_all()
+        return added
+
+    def _work(self):
+        while True:
+            with self._wake:
+                if self._stopping:
+                    return
+                item = self.queue.claim()
+                if item is None:
+                    self._wake.wait(self.poll_interval)
+                    continue
+                self._active += 1
+            try:
+                self._upload(*item)
+            finally:
+                with self._wake:
+                    self._active -= 1
+                    self._wake.notify_all()
+
+    def _upload(self, item_id: int, image_path: str, board_name: str):
+        with metrics.span("publish_image", board=board_name):
+            try:
+                board_id = self.social_media.get_board_id(board_name)
+                if not board_id:
+                    self.queue.fail(item_id, f"board '{board_name}' not found")
+                    metrics.set_attrs(status="error")
+                elif self.social_media.upload_image(board_id, image_path):
+                    self.queue.complete(item_id)
+                else:
+                    self.queue.fail(item_id, "upload failed")
+                    metrics.set_attrs(status="error")
+            except Exception as e:
+                logging.error(f"Error uploading {image_path}: {e}")
+                metrics.mark_error(e)
+                self.queue.fail(item_id, str(e))
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until nothing is pending or uploading (failed uploads are left for a later run).
+        Returns False if the timeout ran out first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._wake:
+                due = self.queue.next_due()
+                if due is None and self._active == 0:
+                    return True
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                waits = [self.poll_interval, due if due else self.poll_interval, remaining]
+                self._wake.wait(min(w for w in waits if w is not None))
+
+    def stop(self):
+        with self._wake:
+            self._stopping = True
+            self._wake.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
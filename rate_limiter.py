@@ -0,0 +1,281 @@
+import time
+import sys
+import random
+import asyncio
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+import metrics
+
+
+def _is_transient_error(error: Exception) -> bool:
+    """Network-level failure worth retrying. HTTP libraries are only checked if already loaded,
+    since an error can't come from one that never was."""
+    if isinstance(error, OSError):
+        return True
+    aiohttp = sys.modules.get("aiohttp")
+    if aiohttp is not None and isinstance(error, aiohttp.ClientError):
+        return True
+    httpx = sys.modules.get("httpx")
+    return httpx is not None and isinstance(error, httpx.TransportError)
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+# Requests per second and burst size for each remote endpoint
+DEFAULT_LIMITS = {
+    "llama": {"rate": 5.0, "burst": 5},
+    "flux": {"rate": 4.0, "burst": 4},
+    "pixtral": {"rate": 1.0, "burst": 2},
+    "pinterest": {"rate": 1 / 3, "burst": 1},
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint that has failed repeatedly and is cooling down."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket whose rate adapts: halved on 429, slowly restored on success."""
+    def __init__(self, rate: float, burst: int, min_rate: Optional[float] = None):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate if min_rate is not None else rate / 16
+        self.capacity = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a token and return how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def throttle(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def recover(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures, then lets a single probe through after reset_timeout."""
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        return self.admit() is not None
+
+    def admit(self) -> Optional[bool]:
+        """None if the call is refused, otherwise whether it is the half-open probe."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return False
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return None
+
+    def release_probe(self):
+        """Let another caller probe after one that ended without an outcome, e.g. a cancelled call."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+def _status_of(obj: Any) -> Optional[int]:
+    status = getattr(obj, "status_code", None)
+    if status is None:
+        response = getattr(obj, "response", None) or getattr(obj, "raw_response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(obj: Any) -> Optional[float]:
+    """Seconds from a Retry-After header on a response or on an exception's response, if any."""
+    headers = getattr(obj, "headers", None)
+    if headers is None:
+        response = getattr(obj, "response", None) or getattr(obj, "raw_response", None)
+        headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class RemoteEndpoint:
+    """Rate limit, retry and circuit-break calls to one remote service.
+    Retries 429/5xx responses and transient network errors with jittered exponential backoff,
+    honouring Retry-After when the server sends it."""
+    def __init__(self, name: str, rate: float, burst: int, max_retries: int = 3, base_delay: float = 0.5,
+                 max_delay: float = 30.0, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def _backoff(self, attempt: int, source: Any) -> float:
+        retry_after = _retry_after(source)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _before_call(self) -> bool:
+        """Raise CircuitOpenError if the circuit refuses the call, else return whether it is the probe."""
+        probe = self.breaker.admit()
+        if probe is None:
+            raise CircuitOpenError(f"{self.name} circuit is open after repeated failures")
+        return probe
+
+    def _check_result(self, result: Any, attempt: int) -> Optional[float]:
+        """Return a retry delay if result is a retryable HTTP response, else record success and return None."""
+        status = _status_of(result)
+        if status in RETRYABLE_STATUS:
+            self.breaker.record_failure()
+            if status == 429:
+                self.bucket.throttle()
+            if attempt < self.max_retries:
+                delay = self._backoff(attempt, result)
+                logging.warning(f"{self.name} returned {status}, retrying in {delay:.1f}s")
+                metrics.add_event("retry", endpoint=self.name, reason=f"http {status}", delay=round(delay, 3))
+                close = getattr(result, "close", None)
+                if callable(close):
+                    close()
+                return delay
+            return None
+        self.breaker.record_success()
+        self.bucket.recover()
+        return None
+
+    def _check_error(self, error: Exception, attempt: int) -> float:
+        """Return a retry delay for a transient error or re-raise it."""
+        status = _status_of(error)
+        transient = status in RETRYABLE_STATUS or (status is None and _is_transient_error(error))
+        if not transient:
+            # The service answered (a 4xx, a bad payload): not a sign it is down, and it ends a probe
+            self.breaker.record_success()
+            raise error
+        self.breaker.record_failure()
+        if status == 429:
+            self.bucket.throttle()
+        if attempt >= self.max_retries:
+            raise error
+        delay = self._backoff(attempt, error)
+        logging.warning(f"{self.name} call failed ({error}), retrying in {delay:.1f}s")
+        metrics.add_event("retry", endpoint=self.name, reason=f"http {status}" if status else type(error).__name__,
+                          delay=round(delay, 3))
+        return delay
+
+    def call(self, fn: Callable[[], Any]) -> Any:
+        """Run fn under the rate limit, retrying retryable responses and errors.
+        The last retryable response is returned as-is so callers keep their own error handling."""
+        for attempt in range(self.max_retries + 1):
+            probe = self._before_call()
+            try:
+                metrics.set_attrs(attempts=attempt + 1)
+                self.bucket.acquire()
+                try:
+                    result = fn()
+                except Exception as e:
+                    delay = self._check_error(e, attempt)
+                else:
+                    delay = self._check_result(result, attempt)
+                    if delay is None:
+                        return result
+            finally:
+                # A probe interrupted before recording an outcome must not hold the circuit half-open forever
+                if probe:
+                    self.breaker.release_probe()
+            time.sleep(delay)
+
+    async def call_async(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Async version of call; fn must return a fresh awaitable on every invocation."""
+        for attempt in range(self.max_retries + 1):
+            probe = self._before_call()
+            try:
+                metrics.set_attrs(attempts=attempt + 1)
+                await self.bucket.acquire_async()
+                try:
+                    result = await fn()
+                except Exception as e:
+                    delay = self._check_error(e, attempt)
+                else:
+                    delay = self._check_result(result, attempt)
+                    if delay is None:
+                        return result
+            finally:
+                # A probe interrupted before recording an outcome must not hold the circuit half-open forever
+                if probe:
+                    self.breaker.release_probe()
+            await asyncio.sleep(delay)
+
+
+_endpoints: Dict[str, RemoteEndpoint] = {}
+_endpoints_lock = threading.Lock()
+
+
+def get_endpoint(name: str) -> RemoteEndpoint:
+    """Process-wide endpoint shared by every client that talks to the same service."""
+    with _endpoints_lock:
+        if name not in _endpoints:
+            _endpoints[name] = RemoteEndpoint(name, **DEFAULT_LIMITS.get(name, {"rate": 2.0, "burst": 2}))
+        return _endpoints[name]
+
+
+def configure_endpoint(name: str, **kwargs) -> RemoteEndpoint:
+    """Replace the shared endpoint for name, e.g. to match a different account quota."""
+    settings = dict(DEFAULT_LIMITS.get(name, {"rate": 2.0, "burst": 2}))
+    settings.update(kwargs)
+    with _endpoints_lock:
+        _endpoints[name] = RemoteEndpoint(name, **settings)
+        return _endpoints[name]
@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import uuid
+import queue
+import signal
+import logging
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# run_title keyword arguments a client may set per job
+JOB_OPTIONS = {"score_threshold": float, "max_retries": int}
+
+_STOP = object()
+
+
+class Job:
+    def __init__(self, title: str, options: dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.title = title
+        self.options = options
+        self.status = QUEUED
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "title": self.title,
+            "status": self.status,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "success": self.result.get("success") if self.result else None,
+            "error": self.error
+        }
+
+
+class JobService:
+    """Runs submitted titles on one long-lived SceneImageGenerator, so its pooled HTTP sessions,
+    clients, caches and Pinterest login are set up once for the whole process.
+    The queue is bounded: submit returns None instead of queueing once it is full."""
+    def __init__(self, generator, workers: int = 2, queue_size: int = 16,
+                 output_root: Optional[str] = None, keep_finished: int = 1000):
+        self.generator = generator
+        self.workers = max(1, workers)
+        self.output_root = output_root or generator.image_generator.output_directory
+        self.keep_finished = keep_finished
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._accepting = True
+        self._durations = []
+        self._threads = []
+
+    def start(self) -> "JobService":
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, title: str, **options) -> Optional[Job]:
+        job = Job(title, options)
+        with self._lock:
+            if not self._accepting:
+                return None
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                return None
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def retry_after(self) -> int:
+        """Rough seconds until a queue slot frees up, from recent job durations."""
+        with self._lock:
+            recent = self._durations[-20:]
+        return max(1, round(sum(recent) / len(recent) / self.workers)) if recent else 5
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return {**counts, "capacity": self._queue.maxsize, "workers": self.workers, "accepting": self._accepting}
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is _STOP:
+                return
+            job.status = RUNNING
+            job.started = time.time()
+            try:
+                job.result = self.generator.run_title(job.title, output_directory=os.path.join(self.output_root, job.id),
+                                                      **job.options)
+                job.error = job.result.get("error")
+                job.status = DONE if job.result.get("success") else FAILED
+            except Exception as e:
+                logging.error(f"Error processing job {job.id} '{job.title}': {e}")
+                job.error = str(e)
+                job.status = FAILED
+            job.finished = time.time()
+            with self._lock:
+                self._durations = self._durations[-99:] + [job.finished - job.started]
+                self._forget_finished()
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in (DONE, FAILED)]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+    def stop(self):
+        """Stop taking jobs, let the workers finish everything already queued, then return."""
+        with self._lock:
+            self._accepting = False
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
+def make_server(service: JobService, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    """Local JSON API over a JobService:
+      POST /jobs {"title": ..., "score_threshold": ..., "max_retries": ...}  -> 202, or 429 when the queue is full
+      GET  /jobs/<id>                                                      -> job status
+      GET  /jobs/<id>/result                                               -> run_title result, 409 until finished
+      GET  /health                                                         -> queue and job counts
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logging.debug(f"{self.address_string()} {format % args}")
+
+        def _send(self, status: int, payload: dict, headers: Optional[dict] = None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if self.path.rstrip("/") != "/jobs":
+                self.rfile.read(length)
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+                title = str(body.get("title") or "").strip()
+                options = {name: cast(body[name]) for name, cast in JOB_OPTIONS.items() if body.get(name) is not None}
+            except (ValueError, TypeError, AttributeError) as e:
+                self._send(400, {"error": f"invalid request: {e}"})
+                return
+            if not title:
+                self._send(400, {"error": "title is required"})
+                return
+            job = service.submit(title, **options)
+            if job is None:
+                if not service.stats()["accepting"]:
+                    self._send(503, {"error": "service is shutting down"})
+                else:
+                    self._send(429, {"error": "job queue is full"}, {"Retry-After": str(service.retry_after())})
+                return
+            self._send(202, job.summary(), {"Location": f"/jobs/{job.id}"})
+
+        def do_GET(self):
+            parts = [part for part in self.path.split("?")[0].split("/") if part]
+            if parts == ["health"]:
+                self._send(200, service.stats())
+                return
+            if len(parts) not in (2, 3) or parts[0] != "jobs" or (len(parts) == 3 and parts[2] != "result"):
+                self._send(404, {"error": "not found"})
+                return
+            job = service.get(parts[1])
+            if job is None:
+                self._send(404, {"error": "unknown job"})
+            elif len(parts) == 2:
+                self._send(200, job.summary())
+            elif job.status in (QUEUED, RUNNING):
+                self._send(409, job.summary())
+            else:
+                self._send(200, job.result or {"title": job.title, "success": False, "error": job.error})
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(generator, host: str = "127.0.0.1", port: int = 8765, workers: int = 2, queue_size: int = 16):
+    """Run the job API until interrupted (Ctrl+C or SIGTERM), then finish the jobs already queued."""
+    service = JobService(generator, workers, queue_size).start()
+    server = make_server(service, host, port)
+    print(f"Serving jobs on http://{host}:{server.server_address[1]} ({workers} workers, queue of {queue_size})")
+
+    def terminate(signum, frame):
+        # shutdown() waits for serve_forever to return, so it cannot run on the thread serving requests
+        logging.info("Received SIGTERM, shutting down")
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    previous = None
+    if threading.current_thread() is threading.main_thread():
+        previous = signal.signal(signal.SIGTERM, terminate)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if previous is not None:
+            signal.signal(signal.SIGTERM, previous)
+        server.server_close()
+        print("\nFinishing queued jobs...")
+        service.stop()
+        logging.info(f"Job service stopped: {service.stats()}")
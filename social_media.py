@@ -1,91 +1,181 @@
 from typing import List, Optional
 import os
-import logging
 import time
-import requests
-from py3pin.Pinterest import Pinterest
+import logging
+import threading
+from http_client import get_session
+from rate_limiter import RemoteEndpoint, get_endpoint
+import metrics
+
+BOARDS_URL = '''https://in.pinterest.com/resource/BoardsResource/get/?source_url=%2Fthetulipjani%2F_created%2F&data=%7B%22options%22%3A%7B%22page_size%22%3A1%2C%22privacy_filter%22%3A%22all%22%2C%22sort%22%3A%22last_pinned_to%22%2C%22username%22%3A%22thetulipjani%22%7D%2C%22context%22%3A%7B%7D%7D&_=1733307913382'''
 
 class SocialMediaManager:
-    def __init__(self, pinterest_email: Optional[str] = None, pinterest_password: Optional[str] = None):
+    def __init__(self, pinterest_email: Optional[str] = None, pinterest_password: Optional[str] = None,
+                 endpoint: Optional[RemoteEndpoint] = None, boards_url: str = BOARDS_URL, client=None,
+                 board_cache_ttl: float = 3600.0, login_retry_seconds: float = 60.0):
+        """client replaces the py3pin session, e.g. with a stand-in that talks to a local test server."""
+        self.endpoint = endpoint or get_endpoint("pinterest")
+        self.boards_url = boards_url
+        # board name -> (board id, fetched at); saves a BoardsResource round trip per publish
+        self.board_cache_ttl = board_cache_ttl
+        self._board_ids = {}
+        self._board_lock = threading.Lock()
         self.pinterest_email = pinterest_email
         self.pinterest_password = pinterest_password
-        self.pinterest = None
-        if pinterest_email and pinterest_password:
-            self.pinterest = Pinterest(email=pinterest_email, password=pinterest_password)
+        # The py3pin session is set up on first use, so runs that never publish skip the import and login
+        self._client = client
+        self._connected = client is not None
+        # Whether the session came from py3pin's saved cookies rather than a fresh login
+        self.reused_session = False
+        self._login_lock = threading.RLock()
+        self.login_retry_seconds = login_retry_seconds
+        self._failed_at: Optional[float] = None
+
+    @property
+    def pinterest(self):
+        """The py3pin client, or None. A failed login is retried on first use after login_retry_seconds,
+        so one bad login does not disable Pinterest for the rest of a long-running process."""
+        with self._login_lock:
+            if self._connected:
+                return self._client
+            if self._failed_at is not None and time.monotonic() - self._failed_at < self.login_retry_seconds:
+                return None
             try:
-                self.pinterest.login()
-                logging.info("Successfully logged into Pinterest")
+                self._client = self._connect()
             except Exception as e:
-                logging.error(f"Failed to login to Pinterest: {e}")
-                self.pinterest = None
+                logging.error(f"Failed to set up the Pinterest session: {e}")
+                self._client = None
+            # Without credentials there is nothing to retry
+            self._connected = self._client is not None or not (self.pinterest_email and self.pinterest_password)
+            self._failed_at = None if self._connected else time.monotonic()
+            return self._client
+
+    def _connect(self):
+        if not (self.pinterest_email and self.pinterest_password):
+            return None
+        from py3pin.Pinterest import Pinterest
+        client = Pinterest(email=self.pinterest_email, password=self.pinterest_password)
+        if client.old_cookies:
+            self.reused_session = True
+            logging.info("Reusing saved Pinterest session")
+            return client
+        return client if self._login(client) else None
+
+    def _login(self, client) -> bool:
+        try:
+            client.login()
+            logging.info("Successfully logged into Pinterest")
+            return True
+        except Exception as e:
+            logging.error(f"Failed to login to Pinterest: {e}")
+            return False
+
+    def _refresh_session(self) -> bool:
+        """Log in again once if a saved session turns out to be stale. Returns whether to retry."""
+        with self._login_lock:
+            if not self.reused_session:
+                return False
+            self.reused_session = False
+            logging.info("Saved Pinterest session rejected, logging in again")
+            return self._login(self._client)
+
+    def _cached_board_id(self, board_name: str) -> Optional[str]:
+        with self._board_lock:
+            cached = self._board_ids.get(board_name)
+            if cached is not None and time.monotonic() - cached[1] < self.board_cache_ttl:
+                return cached[0]
+            return None
+
+    def get_board_id(self, board_name: str = "AI") -> Optional[str]:
+        """Board id for board_name, fetched from BoardsResource at most once per board_cache_ttl seconds.
+        The fetch runs outside the cache lock, so a slow one never stalls workers with a cached id."""
+        board_id = self._cached_board_id(board_name)
+        if board_id is not None:
+            return board_id
+
+        response = self.endpoint.call(lambda: get_session().get(self.boards_url, timeout=30))
+        metrics.set_attrs(status=response.status_code)
+        if response.status_code != 200:
+            logging.error(f"Failed to fetch board information: {response.status_code}")
+            return None
+
+        fetched_at = time.monotonic()
+        boards = {board['name']: (board['id'], fetched_at) for board in response.json()['resource_response']['data']}
+        with self._board_lock:
+            self._board_ids.update(boards)
+
+        if board_name not in boards:
+            logging.error(f"Board '{board_name}' not found in the response.")
+            return None
+        return boards[board_name][0]
+
+    def upload_image(self, board_id: str, image_path: str) -> bool:
+        """Upload one image as a pin. Pacing between pins comes from the shared pinterest rate limit."""
+        scene_number = os.path.basename(image_path).split('_')[1].split('.')[0]
+        pin_title = f"AI Generated Concept Art - Scene {scene_number}"
+        pin_description = f"AI generated concept art showcasing unique perspectives and creative compositions. Scene {scene_number}"
+        pin_hashtags = "#AIArt #ConceptArt #DigitalArt #ArtificialIntelligence #CreativeAI #GenerativeArt"
+
+        logging.info(f"Attempting to upload: {image_path}")
+        logging.info(f"Title: {pin_title}")
+        logging.info(f"Description: {pin_description}")
+
+        abs_image_path = os.path.abspath(image_path)
+        if not os.path.exists(abs_image_path):
+            logging.error(f"Image file not found: {abs_image_path}")
+            return False
+        if self.pinterest is None:
+            logging.error("Pinterest session not available; the login is retried later")
+            return False
+
+        def upload():
+            return self.endpoint.call(lambda: self.pinterest.upload_pin(
+                board_id=board_id,
+                image_file=abs_image_path,
+                description=f"{pin_description}\n\n{pin_hashtags}",
+                title=pin_title
+            ))
+
+        try:
+            response = upload()
+        except Exception:
+            if not self._refresh_session():
+                raise
+            response = upload()
+        if not response and self._refresh_session():
+            response = upload()
+
+        if response:
+            logging.info(f"Successfully uploaded {image_path} to Pinterest.")
+            return True
+        logging.error(f"Failed to upload {image_path}.")
+        return False
 
     def publish_to_pinterest(self, image_paths: List[str], board_name: str = "AI") -> bool:
         """Publish generated images to Pinterest."""
+        with metrics.span("publish_to_pinterest", images=len(image_paths)):
+            return self._publish_to_pinterest(image_paths, board_name)
+
+    def _publish_to_pinterest(self, image_paths: List[str], board_name: str) -> bool:
         if not self.pinterest:
             logging.error("Pinterest not initialized. Check credentials.")
             return False
 
         try:
-            
-            url = '''https://in.pinterest.com/resource/BoardsResource/get/?source_url=%2Fthetulipjani%2F_created%2F&data=%7B%22options%22%3A%7B%22page_size%22%3A1%2C%22privacy_filter%22%3A%22all%22%2C%22sort%22%3A%22last_pinned_to%22%2C%22username%22%3A%22thetulipjani%22%7D%2C%22context%22%3A%7B%7D%7D&_=1733307913382'''
-            
-            response = requests.get(url)
-            if response.status_code != 200:
-                logging.error(f"Failed to fetch board information: {response.status_code}")
-                return False
-
-            board_data = response.json()
-            board_id = None
-            for board in board_data['resource_response']['data']:
-                if board['name'] == board_name:
-                    board_id = board['id']
-                    break
-
+            board_id = self.get_board_id(board_name)
             if not board_id:
-                logging.error(f"Board '{board_name}' not found in the response.")
                 return False
 
             successful_uploads = 0
-
             for image_path in image_paths:
                 try:
-                    
-                    scene_number = os.path.basename(image_path).split('_')[1].split('.')[0]
-                    pin_title = f"AI Generated Concept Art - Scene {scene_number}"
-                    pin_description = f"AI generated concept art showcasing unique perspectives and creative compositions. Scene {scene_number}"
-                    pin_hashtags = "#AIArt #ConceptArt #DigitalArt #ArtificialIntelligence #CreativeAI #GenerativeArt"
-
-                    
-                    logging.info(f"Attempting to upload: {image_path}")
-                    logging.info(f"Title: {pin_title}")
-                    logging.info(f"Description: {pin_description}")
-
-                    
-                    abs_image_path = os.path.abspath(image_path)
-                    if not os.path.exists(abs_image_path):
-                        logging.error(f"Image file not found: {abs_image_path}")
-                        continue
-
-                    
-                    response = self.pinterest.upload_pin(
-                        board_id=board_id,
-                        image_file=abs_image_path,
-                        description=f"{pin_description}\n\n{pin_hashtags}",
-                        title=pin_title
-                    )
-
-                    if response:
-                        logging.info(f"Successfully uploaded {image_path} to Pinterest.")
+                    if self.upload_image(board_id, image_path):
                         successful_uploads += 1
-                    else:
-                        logging.error(f"Failed to upload {image_path}.")
-
-                    time.sleep(3)  
-
                 except Exception as e:
                     logging.error(f"Error uploading {image_path}: {e}")
                     continue
 
+            metrics.set_attrs(uploaded=successful_uploads)
             if successful_uploads == len(image_paths):
                 logging.info("All images uploaded successfully.")
                 return True
@@ -95,4 +185,5 @@ class SocialMediaManager:
 
         except Exception as e:
             logging.error(f"Pinterest publishing error: {e}")
-            return False
\ No newline at end of file
+            metrics.mark_error(e)
+            return False